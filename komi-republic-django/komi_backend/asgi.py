@@ -2,6 +2,8 @@
 ASGI config for komi_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Besides the regular API it serves the async endpoints under ``/api/async/``
+and the Server-Sent Events stream ``/api/live/``, which needs an ASGI server.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -14,3 +16,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'komi_backend.settings')
 
 application = get_asgi_application()
+
+# Build in-memory indexes when the worker starts rather than on the first request
+from places.autocomplete import warm_index  # noqa: E402
+
+warm_index()
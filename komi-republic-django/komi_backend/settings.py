@@ -44,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'places.metrics.MetricsMiddleware',
+    'places.timing.ServerTimingMiddleware',
+    'places.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -78,25 +81,164 @@ WSGI_APPLICATION = 'komi_backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# SQLite by default; DB_ENGINE=postgresql switches to PostgreSQL configured by DB_* variables.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'komi_db'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if os.getenv('DB_POOL', 'False') == 'True':
+        # psycopg 3 connection pool per worker process (needs psycopg[pool]);
+        # pooled connections are returned after each request, so CONN_MAX_AGE must stay 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+    if os.getenv('SQLITE_TUNED', 'True') == 'True':
+        # Several gunicorn workers on one file: WAL lets readers run alongside the
+        # writer, IMMEDIATE transactions queue for the write lock (up to the busy
+        # timeout) instead of failing with "database is locked" on a lock upgrade
+        DATABASES['default']['OPTIONS'] = {
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                f'PRAGMA mmap_size={int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))};'
+                'PRAGMA cache_size=-20000'
+            ),
+        }
+
+# Persistent connections, checked before reuse so a restarted database server
+# costs one failed ping instead of a failed request
+DATABASES['default']['CONN_MAX_AGE'] = (
+    0 if 'pool' in DATABASES['default'].get('OPTIONS', {}) else int(os.getenv('DB_CONN_MAX_AGE', 60))
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Read replicas: DB_REPLICA_HOSTS=host1,host2:5433 adds aliases replica1, replica2...
+# with the primary's credentials. GET requests read from them, see places/replicas.py.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default'].get('PORT', ''),
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['places.replicas.PrimaryReplicaRouter']
+
+# Seconds a client reads from the primary after its own write
+REPLICA_LAG_SECONDS = int(os.getenv('REPLICA_LAG_SECONDS', 5))
+
+# Queue review POSTs and insert them in batches, see places/write_behind.py
+REVIEW_WRITE_BEHIND = os.getenv('REVIEW_WRITE_BEHIND', 'False') == 'True'
+REVIEW_BATCH_SIZE = int(os.getenv('REVIEW_BATCH_SIZE', 100))
+REVIEW_FLUSH_INTERVAL = float(os.getenv('REVIEW_FLUSH_INTERVAL', 0.5))
+
+# Seconds a saved place waits for its similar places refresh, see places/similar.py; 0 refreshes on commit
+SIMILAR_REFRESH_INTERVAL = float(os.getenv('SIMILAR_REFRESH_INTERVAL', 1))
 
-DATABASES = {
+# Delta sync for offline clients, see places/sync.py
+# Rows per model in one /api/sync/ response
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 1000))
+# Changes younger than this are left for the next sync, so slow transactions are not skipped
+SYNC_SETTLE_SECONDS = int(os.getenv('SYNC_SETTLE_SECONDS', 5))
+# Tombstones of deleted rows are pruned after this; older tokens get a full download
+SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', 90))
+
+# Live review stream (/api/live/, ASGI only), see places/live.py
+# Seconds between reads of changes made by other workers; 0 streams only this worker's writes
+LIVE_POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', 2))
+LIVE_HEARTBEAT_SECONDS = int(os.getenv('LIVE_HEARTBEAT_SECONDS', 15))
+
+
+# Cache
+# File-based by default so that all gunicorn workers on a box share entries
+# and invalidations. Point CACHE_BACKEND at Redis/Memcached for multi-host setups.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 24 * 60 * 60)),
     }
 }
 
-# For production with PostgreSQL, uncomment and configure:
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.getenv('DB_NAME', 'komi_db'),
-#         'USER': os.getenv('DB_USER', 'postgres'),
-#         'PASSWORD': os.getenv('DB_PASSWORD', ''),
-#         'HOST': os.getenv('DB_HOST', 'localhost'),
-#         'PORT': os.getenv('DB_PORT', '5432'),
-#     }
-# }
+# Seconds to keep cached API responses; 0 disables the response cache
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 60 * 60))
+
+
+# Request timing
+# Server-Timing header with db/serialize/render/total durations of every request
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+# Requests slower than this (ms) or running at least this many queries are logged with their SQL
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', 50))
+
+
+# Metrics
+# Per-worker request counters and histograms, summed across gunicorn workers by /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# Bearer token for scrapes; without it /metrics only answers direct requests from localhost
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+
+# Logging
+# Warnings (slow requests, failed image variants) go to stderr, which gunicorn
+# forwards to its error log
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name} [{process}] {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'places': {
+            'handlers': ['console'],
+            'level': os.getenv('PLACES_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
 
 
 # Password validation
@@ -149,10 +291,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Page numbers by default, keyset cursors with ?pagination=cursor
+    'DEFAULT_PAGINATION_CLASS': 'places.pagination.SelectablePagination',
     'PAGE_SIZE': 100,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'places.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
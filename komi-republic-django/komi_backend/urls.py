@@ -6,9 +6,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from places.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('places.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'komi_backend.settings')
 
 application = get_wsgi_application()
+
+# Build in-memory indexes when the worker starts rather than on the first request
+from places.autocomplete import warm_index  # noqa: E402
+
+warm_index()
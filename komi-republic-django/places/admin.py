@@ -25,10 +25,13 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Place)
 class PlaceAdmin(admin.ModelAdmin):
     """Admin for Place model"""
-    list_display = ('name_ru', 'category', 'rating', 'is_open', 'published', 'created_at')
+    list_display = ('name_ru', 'category', 'rating', 'review_avg', 'review_count', 'is_open', 'published', 'created_at')
     list_filter = ('category', 'published', 'is_open', 'created_at')
     search_fields = ('name', 'name_ru', 'description', 'description_ru', 'address', 'address_ru')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = (
+        'review_count', 'review_avg', 'review_count_1', 'review_count_2',
+        'review_count_3', 'review_count_4', 'review_count_5', 'created_at', 'updated_at'
+    )
     inlines = [PlaceImageInline]
     
     fieldsets = (
@@ -47,6 +50,13 @@ class PlaceAdmin(admin.ModelAdmin):
         ('Дополнительная информация', {
             'fields': ('opening_hours', 'opening_hours_ru', 'entry_fee', 'entry_fee_ru', 'amenities', 'is_open')
         }),
+        ('Отзывы', {
+            'fields': (
+                'review_count', 'review_avg', 'review_count_1', 'review_count_2',
+                'review_count_3', 'review_count_4', 'review_count_5'
+            ),
+            'classes': ('collapse',)
+        }),
         ('Системная информация', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
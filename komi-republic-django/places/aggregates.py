@@ -0,0 +1,143 @@
+"""
+Review aggregates denormalized onto Place
+
+Counters are adjusted with single F-expression UPDATEs as reviews are
+created, published, unpublished, moved or deleted, so concurrent writers
+never lose an increment. ``recompute_review_aggregates`` rebuilds them from
+the review table after bulk loads.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connections
+from django.db.models import Case, Count, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .models import Place, Review
+
+STAR_FIELDS = {star: f'review_count_{star}' for star in range(1, 6)}
+AVERAGE_FIELD = Place._meta.get_field('review_avg')
+AVERAGE_STEP = Decimal(1).scaleb(-AVERAGE_FIELD.decimal_places)
+
+
+def _star_total():
+    total = Value(0)
+    for star, field in STAR_FIELDS.items():
+        total = total + F(field) * star
+    return total
+
+
+def apply_review_delta(place_id, rating, delta, using='default'):
+    """Add (delta=1) or remove (delta=-1) one published review from a place's aggregates"""
+    if place_id is None or rating not in STAR_FIELDS:
+        return
+    new_count = F('review_count') + delta
+    new_total = _star_total() + rating * delta
+    Place.objects.using(using).filter(pk=place_id).update(
+        review_count=new_count,
+        **{STAR_FIELDS[rating]: F(STAR_FIELDS[rating]) + delta},
+        # SET expressions read pre-update values, so the average uses the new totals explicitly
+        # Rounded like recompute_review_aggregates, so a recount finds nothing to change
+        review_avg=Case(
+            When(review_count=-delta, then=Value(Decimal(0))),
+            default=Round(
+                Cast(
+                    Cast(new_total, FloatField()) / Cast(new_count, FloatField()),
+                    DecimalField(max_digits=AVERAGE_FIELD.max_digits, decimal_places=AVERAGE_FIELD.decimal_places),
+                ),
+                AVERAGE_FIELD.decimal_places,
+            ),
+            output_field=DecimalField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def review_saved(review, created, using='default'):
+    """Adjust aggregates for a saved review, comparing it with the row as it was loaded"""
+    new = (review.place_id, review.rating) if review.published else None
+    if created:
+        old = None
+    else:
+        loaded = getattr(review, '_loaded_values', None)
+        if loaded is None or not {'place_id', 'rating', 'published'} <= loaded.keys():
+            # Previous state unknown, fall back to a recount of the affected place
+            recompute_review_aggregates(place_ids=[review.place_id], using=using)
+            return
+        old = (loaded['place_id'], loaded['rating']) if loaded['published'] else None
+    if old == new:
+        return
+    if old is not None:
+        apply_review_delta(*old, -1, using=using)
+    if new is not None:
+        apply_review_delta(*new, 1, using=using)
+
+
+def review_deleted(review, using='default'):
+    loaded = getattr(review, '_loaded_values', None) or {}
+    if loaded.get('published', review.published):
+        apply_review_delta(
+            loaded.get('place_id', review.place_id),
+            loaded.get('rating', review.rating),
+            -1,
+            using=using,
+        )
+
+
+def recompute_review_aggregates(place_ids=None, using='default', batch_size=1000,
+                                place_model=Place, review_model=Review):
+    """Recount aggregates from published reviews, returning the number of places that changed"""
+    places = place_model._default_manager.using(using).order_by('pk')
+    if place_ids is not None:
+        places = places.filter(pk__in=place_ids)
+    pks = list(places.values_list('pk', flat=True))
+
+    # One parametrized UPDATE per place through executemany, bulk_update's CASE
+    # expressions grow too slow for tens of thousands of places. Places whose
+    # aggregates already match are left alone, so updated_at only moves for
+    # the ones that changed
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = [place_model._meta.get_field(name) for name in ('review_count', 'review_avg', *STAR_FIELDS.values())]
+    updated_at = place_model._meta.get_field('updated_at')
+    sql = 'UPDATE {} SET {}, {} = %s WHERE {} = %s AND NOT ({})'.format(
+        quote(place_model._meta.db_table),
+        ', '.join(f'{quote(field.column)} = %s' for field in fields),
+        quote(updated_at.column),
+        quote(place_model._meta.pk.column),
+        ' AND '.join(f'{quote(field.column)} = %s' for field in fields),
+    )
+    now = updated_at.get_db_prep_save(timezone.now(), connection)
+
+    updated = 0
+    for start in range(0, len(pks), batch_size):
+        batch_ids = pks[start:start + batch_size]
+        stars = defaultdict(dict)
+        rows = (
+            review_model._default_manager.using(using)
+            .filter(published=True, place_id__in=batch_ids)
+            .order_by()
+            .values_list('place_id', 'rating')
+            .annotate(count=Count('id'))
+        )
+        for place_id, rating, count in rows:
+            stars[place_id][rating] = count
+
+        params = []
+        for place_id in batch_ids:
+            counts = stars.get(place_id, {})
+            total_count = sum(counts.get(star, 0) for star in STAR_FIELDS)
+            total_stars = sum(star * counts.get(star, 0) for star in STAR_FIELDS)
+            # Half away from zero, as SQL ROUND in apply_review_delta
+            average = (
+                (Decimal(total_stars) / total_count).quantize(AVERAGE_STEP, rounding=ROUND_HALF_UP)
+                if total_count else Decimal(0)
+            )
+            values = [total_count, average, *(counts.get(star, 0) for star in STAR_FIELDS)]
+            values = [field.get_db_prep_save(value, connection) for field, value in zip(fields, values)]
+            params.append([*values, now, place_id, *values])
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+            updated += cursor.rowcount
+    return updated
@@ -0,0 +1,64 @@
+"""
+Amenity filters for places app
+
+``Place.amenities`` is a JSON list, which SQLite can only filter by parsing
+the JSON of every row. ``PlaceAmenity`` holds one row per (amenity, place),
+refreshed by the Place save signal, so ``?amenities=hiking,camping`` (all of
+them) and ``?amenities_any=cafe,wifi`` (at least one) become subqueries on
+its unique index that combine with the other filters of the queryset.
+"""
+from django.db import connections
+
+from .models import PlaceAmenity
+
+AMENITY_MAX_LENGTH = PlaceAmenity._meta.get_field('amenity').max_length
+
+
+def normalize(amenities):
+    """Distinct lowercased names of a Place.amenities value"""
+    if not isinstance(amenities, list):
+        return []
+    names = (str(item).strip().lower()[:AMENITY_MAX_LENGTH] for item in amenities)
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def filter_by_amenities(queryset, all_of=(), any_of=()):
+    """Places with every amenity in all_of and at least one in any_of"""
+    for name in all_of:
+        queryset = queryset.filter(pk__in=PlaceAmenity.objects.filter(amenity=name).values('place_id'))
+    if any_of:
+        queryset = queryset.filter(pk__in=PlaceAmenity.objects.filter(amenity__in=any_of).values('place_id'))
+    return queryset
+
+
+def index_amenities(place, using='default'):
+    """Replace the index rows of a saved place"""
+    entries = PlaceAmenity.objects.using(using)
+    entries.filter(place_id=place.pk).delete()
+    entries.bulk_create([PlaceAmenity(place_id=place.pk, amenity=name) for name in normalize(place.amenities)])
+
+
+def rebuild_index(place_model, using='default', batch_size=1000, amenity_model=PlaceAmenity):
+    """
+    Repopulate the index from Place.amenities, returning the number of indexed
+    rows. Migrations pass their historical place_model and amenity_model.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = quote(amenity_model._meta.db_table)
+    columns = ', '.join(quote(amenity_model._meta.get_field(name).column) for name in ('place', 'amenity'))
+    rows = place_model._default_manager.using(using).order_by().values_list('pk', 'amenities')
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        batch = []
+        for place_id, amenities in rows.iterator(chunk_size=batch_size):
+            batch.extend((place_id, name) for name in normalize(amenities))
+            if len(batch) >= batch_size:
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES (%s, %s)', batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES (%s, %s)', batch)
+            count += len(batch)
+    return count
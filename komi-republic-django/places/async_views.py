@@ -0,0 +1,169 @@
+"""
+Async read endpoints for places app
+
+Served under ``/api/async/`` for ASGI servers such as uvicorn. Querysets,
+filters, sparse fields and serializers come from the sync viewsets, so the
+payloads match ``/api/...``; only the queries run through the async ORM
+(``acount``, ``async for``). Responses skip the response cache and
+conditional GET of the sync viewsets.
+"""
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import exception_handler
+
+from .live import get_broker
+from .pagination import KeysetPagination, SelectablePagination
+from .renderers import FastJSONRenderer
+from .views import CategoryViewSet, PlaceViewSet, ReviewViewSet
+
+PAGE_SIZE = api_settings.PAGE_SIZE
+
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def bind(viewset_class, request, action, **kwargs):
+    """Viewset instance set up for request as its dispatch() would, without running a handler"""
+    view = viewset_class(
+        action_map={'get': action, 'head': action}, format_kwarg=None, args=(), kwargs=kwargs, headers={},
+    )
+    view.request = view.initialize_request(request)
+    return view
+
+
+def api_view(func):
+    """Turn DRF exceptions (validation errors, 404s) into JSON responses like the sync views"""
+    @csrf_exempt
+    @wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            return await func(request, *args, **kwargs)
+        except (APIException, Http404) as exc:
+            response = exception_handler(exc, {})
+            return json_response(response.data, status=response.status_code)
+    return wrapper
+
+
+def row_queryset(view, queryset):
+    """(queryset, serialize) using values() rows when the serializer allows it"""
+    row_serializer = view.get_row_serializer()
+    if row_serializer is None:
+        return queryset, lambda objects: view.get_serializer(objects, many=True).data
+    return row_serializer.values(queryset, view.get_row_columns(queryset)), row_serializer.to_representation
+
+
+async def paginated(view, queryset, serialize):
+    """Page-number pagination with the same links as PageNumberPagination"""
+    request = view.request
+    if (request.query_params.get(SelectablePagination.pagination_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params):
+        # Keyset pages are one indexed query; run the sync paginator in a thread
+        paginator = KeysetPagination()
+        page = await sync_to_async(paginator.paginate_queryset)(queryset, request, view)
+        return json_response(paginator.get_paginated_response(serialize(page)).data)
+
+    try:
+        number = int(request.query_params.get(PageNumberPagination.page_query_param, 1))
+    except ValueError:
+        raise NotFound(PageNumberPagination.invalid_page_message)
+    count = await queryset.acount()
+    if number < 1 or number > max(1, ceil(count / PAGE_SIZE)):
+        raise NotFound(PageNumberPagination.invalid_page_message)
+    offset = (number - 1) * PAGE_SIZE
+    rows = [row async for row in queryset[offset:offset + PAGE_SIZE]]
+
+    url = request.build_absolute_uri()
+    next_link = replace_query_param(url, 'page', number + 1) if offset + PAGE_SIZE < count else None
+    if number == 1:
+        previous_link = None
+    elif number == 2:
+        previous_link = remove_query_param(url, 'page')
+    else:
+        previous_link = replace_query_param(url, 'page', number - 1)
+    return json_response({'count': count, 'next': next_link, 'previous': previous_link, 'results': serialize(rows)})
+
+
+@api_view
+async def category_list(request):
+    view = bind(CategoryViewSet, request, 'list')
+    queryset = view.filter_queryset(view.get_queryset())
+    return await paginated(view, queryset, lambda objects: view.get_serializer(objects, many=True).data)
+
+
+@api_view
+async def place_list(request):
+    view = bind(PlaceViewSet, request, 'list')
+    queryset, serialize = row_queryset(view, view.filter_queryset(view.get_queryset()))
+    return await paginated(view, queryset, serialize)
+
+
+@api_view
+async def place_featured(request):
+    view = bind(PlaceViewSet, request, 'featured')
+    queryset, serialize = row_queryset(view, view.get_queryset().order_by('-rating')[:view.get_featured_limit()])
+    return json_response(serialize([row async for row in queryset]))
+
+
+@api_view
+async def place_detail(request, pk):
+    view = bind(PlaceViewSet, request, 'retrieve', pk=pk)
+    # Gallery images are prefetched as part of the async iteration
+    place = await view.get_queryset().filter(pk=pk).afirst()
+    if place is None:
+        raise Http404('No Place matches the given query.')
+    return json_response(view.get_serializer(place).data)
+
+
+@api_view
+async def review_list(request):
+    view = bind(ReviewViewSet, request, 'list')
+    queryset = view.filter_queryset(view.get_queryset())
+    return await paginated(view, queryset, lambda objects: view.get_serializer(objects, many=True).data)
+
+
+@api_view
+async def live_stream(request):
+    """
+    Server-Sent Events with new or edited published reviews (``event: review``)
+    and rating changes of places (``event: rating``), for ?place=1,2 and/or
+    ?category=slug.
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI would buffer the endless stream instead of sending it
+        return json_response({'detail': 'The live stream needs the ASGI server (komi_backend.asgi).'}, status=501)
+    try:
+        places = [int(value) for value in request.GET.get('place', '').split(',') if value.strip()]
+    except ValueError:
+        raise ValidationError({'place': 'Must be comma-separated integers.'})
+    subscription = get_broker().subscribe(places, request.GET.get('category') or None)
+
+    async def events():
+        try:
+            yield b'retry: 5000\n\n'
+            while not subscription.overflowed:
+                message = await subscription.get(settings.LIVE_HEARTBEAT_SECONDS)
+                # Comments keep proxies from closing an idle connection
+                yield b': ping\n\n' if message is None else message
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,125 @@
+"""
+In-memory prefix index for place name suggestions
+
+Every worker keeps a sorted list of normalized name keys (the full name and
+each word start of both ``name`` and ``name_ru``) and answers prefix queries
+with a binary search. The index is rebuilt when the ``places.autocomplete``
+generation, bumped from Place signals, moves on.
+"""
+import heapq
+import threading
+from bisect import bisect_left
+
+from django.db import DatabaseError
+
+from .cache import get_generation
+from .models import Place
+from .stemming import WORD_RE
+
+AUTOCOMPLETE_GENERATION = 'places.autocomplete'
+INDEXED_FIELDS = ('name', 'name_ru', 'rating', 'published')
+MAX_SUGGESTIONS = 20
+SHORT_PREFIX_LENGTH = 2
+# Results for prefixes matching more keys than this are memoized per index
+MEMO_RANGE_SIZE = 1000
+
+_index = None
+_lock = threading.Lock()
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower().replace('ё', 'е')))
+
+
+class PrefixIndex:
+    """Sorted prefix index over place names, best rated places first"""
+
+    def __init__(self, places, generation=None):
+        self.generation = generation
+        # places arrive ordered by rating, so the list position is the rank
+        self.suggestions = [
+            {'id': place_id, 'name': name, 'name_ru': name_ru}
+            for place_id, name, name_ru in places
+        ]
+        entries = set()
+        for rank, suggestion in enumerate(self.suggestions):
+            for name in (suggestion['name'], suggestion['name_ru']):
+                words = normalize(name).split()
+                for start in range(len(words)):
+                    entries.add((' '.join(words[start:]), rank))
+        entries = sorted(entries)
+        self.keys = [key for key, rank in entries]
+        self.ranks = [rank for key, rank in entries]
+
+        # Short prefixes match a large share of the keys, so precompute them
+        self.short = {}
+        for key, rank in entries:
+            for length in range(1, SHORT_PREFIX_LENGTH + 1):
+                if len(key) >= length:
+                    self.short.setdefault(key[:length], set()).add(rank)
+        self.short = {
+            prefix: sorted(ranks)[:MAX_SUGGESTIONS] for prefix, ranks in self.short.items()
+        }
+        self.memo = {}
+
+    def search(self, query, limit=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            ranks = self.short.get(prefix, [])
+        else:
+            ranks = self.memo.get(prefix)
+            if ranks is None:
+                ranks = self._best_ranks(prefix)
+        return [self.suggestions[rank] for rank in ranks[:limit]]
+
+    def _best_ranks(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', lo=start)
+        candidates = self.ranks[start:end]
+        # A place can match through several keys, so widen until enough are distinct
+        wanted = MAX_SUGGESTIONS * 2
+        while True:
+            ranks = sorted(set(heapq.nsmallest(wanted, candidates)))
+            if len(ranks) >= MAX_SUGGESTIONS or wanted >= len(candidates):
+                break
+            wanted *= 4
+        ranks = ranks[:MAX_SUGGESTIONS]
+        if end - start > MEMO_RANGE_SIZE:
+            self.memo[prefix] = ranks
+        return ranks
+
+
+def build_index(generation=None):
+    places = (
+        Place.objects.filter(published=True)
+        .order_by('-rating', 'name_ru', 'id')
+        .values_list('id', 'name', 'name_ru')
+    )
+    return PrefixIndex(places, generation=generation)
+
+
+def get_index():
+    """Return this worker's index, rebuilding it if places changed since it was built"""
+    global _index
+    generation = get_generation(AUTOCOMPLETE_GENERATION)
+    index = _index
+    if index is None or index.generation != generation:
+        with _lock:
+            if _index is None or _index.generation != generation:
+                _index = build_index(generation)
+            index = _index
+    return index
+
+
+def suggest(query, limit=10):
+    return get_index().search(query, limit=max(1, min(limit, MAX_SUGGESTIONS)))
+
+
+def warm_index():
+    """Build the index at worker start; a missing table (before migrate) is not fatal"""
+    try:
+        get_index()
+    except DatabaseError:
+        pass
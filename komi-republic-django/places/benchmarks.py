@@ -0,0 +1,168 @@
+"""
+API benchmark scenarios and budgets for places app
+
+Every route of ``places.urls`` has at least one scenario with a budget for
+the number of SQL queries and the p95 latency of a request. A serializer
+that starts querying per row breaks the query budget long before it shows
+up in latency.
+"""
+import statistics
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Category, Place, Review
+from .sync import current_token
+from .urls import router
+
+
+@dataclass
+class Scenario:
+    """One request to benchmark; kwargs and params may use {place}, {places}, {category}, {review} and {sync}"""
+    route: str
+    label: str
+    max_queries: int
+    p95_ms: float
+    kwargs: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+
+
+@dataclass
+class Result:
+    scenario: Scenario
+    url: str
+    status: int
+    queries: int
+    timings: list
+
+    def percentile(self, percent):
+        ordered = sorted(self.timings)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    @property
+    def p50(self):
+        return statistics.median(self.timings)
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    @property
+    def throughput(self):
+        return len(self.timings) / (sum(self.timings) / 1000)
+
+    def failures(self, latency_factor=1.0):
+        failures = []
+        if self.status != 200:
+            failures.append(f'status {self.status}')
+        if self.queries > self.scenario.max_queries:
+            failures.append(f'{self.queries} queries > {self.scenario.max_queries}')
+        if self.p95 > self.scenario.p95_ms * latency_factor:
+            failures.append(f'p95 {self.p95:.1f} ms > {self.scenario.p95_ms * latency_factor:.0f} ms')
+        return failures
+
+
+# Query budgets count the conditional GET validators, the page COUNT(*) and
+# the prefetches, all of which are fixed per request
+SCENARIOS = [
+    Scenario('category-list', 'categories', max_queries=3, p95_ms=50),
+    Scenario('category-detail', 'category', max_queries=2, p95_ms=50, kwargs={'slug': '{category}'}),
+    Scenario('place-list', 'places', max_queries=3, p95_ms=150),
+    Scenario('place-list', 'places page 5', max_queries=3, p95_ms=150, params={'page': 5}),
+    Scenario('place-list', 'places cursor', max_queries=2, p95_ms=150, params={'pagination': 'cursor'}),
+    Scenario('place-list', 'places by category', max_queries=3, p95_ms=150, params={'category': '{category}'}),
+    Scenario('place-list', 'places by name', max_queries=3, p95_ms=150, params={'ordering': 'name'}),
+    # Ranking must stay one MATCH per query: a per-row MATCH takes seconds for a word in thousands of places
+    Scenario('place-list', 'places search', max_queries=3, p95_ms=100, params={'search': 'озеро'}),
+    Scenario('place-list', 'places search common word', max_queries=3, p95_ms=150, params={'search': 'музей'}),
+    Scenario('place-list', 'places search + category', max_queries=3, p95_ms=150,
+             params={'search': 'museum', 'category': 'museums'}),
+    Scenario('place-list', 'places by amenities', max_queries=3, p95_ms=100,
+             params={'amenities': 'hiking,parking'}),
+    Scenario('place-list', 'places by any amenity', max_queries=3, p95_ms=100,
+             params={'amenities_any': 'cafe,wifi', 'category': '{category}'}),
+    Scenario('place-list', 'places ru fields', max_queries=3, p95_ms=100,
+             params={'lang': 'ru', 'fields': 'id,name,rating,image_url,image_srcset'}),
+    Scenario('place-detail', 'place', max_queries=3, p95_ms=50, kwargs={'pk': '{place}'}),
+    Scenario('place-featured', 'featured', max_queries=2, p95_ms=60),
+    Scenario('place-batch', 'batch of 20', max_queries=2, p95_ms=60, params={'ids': '{places}'}),
+    Scenario('place-batch', 'batch of 20 + embeds', max_queries=4, p95_ms=150,
+             params={'ids': '{places}', 'include': 'images,reviews,category'}),
+    Scenario('place-similar', 'similar places', max_queries=2, p95_ms=50, kwargs={'pk': '{place}'}),
+    Scenario('place-autocomplete', 'autocomplete', max_queries=0, p95_ms=20, params={'q': 'выч'}),
+    Scenario('place-nearby', 'nearby', max_queries=3, p95_ms=200,
+             params={'lat': 61.67, 'lon': 50.84, 'radius_km': 20}),
+    Scenario('place-clusters', 'clusters', max_queries=0, p95_ms=100, params={'zoom': 6}),
+    Scenario('review-list', 'reviews', max_queries=3, p95_ms=150),
+    Scenario('review-list', 'reviews by place', max_queries=3, p95_ms=50, params={'place': '{place}'}),
+    Scenario('review-detail', 'review', max_queries=2, p95_ms=50, kwargs={'pk': '{review}'}),
+    Scenario('sync-list', 'sync first page', max_queries=4, p95_ms=1500),
+    Scenario('sync-list', 'sync up to date', max_queries=5, p95_ms=30, params={'since': '{sync}'}),
+]
+
+
+def router_routes():
+    return {pattern.name for pattern in router.urls if pattern.name != 'api-root'}
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    """Routes of places.urls without a benchmark scenario"""
+    return router_routes() - {scenario.route for scenario in scenarios}
+
+
+class BenchmarkRunner:
+    def __init__(self, iterations=50, warmup=3, host='localhost'):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.client = Client(HTTP_HOST=host)
+        self.samples = self.sample_values()
+
+    @staticmethod
+    def sample_values():
+        """Ids used in scenario URLs: the most reviewed published places and the first review of the top one"""
+        top = list(Place.objects.filter(published=True).order_by('-review_count', 'pk')[:20])
+        place = top[0] if top else None
+        review = Review.objects.filter(published=True, place=place).order_by('pk').first()
+        category = Category.objects.filter(published=True).order_by('pk').first()
+        return {
+            'place': place.pk if place else 0,
+            'places': ','.join(str(item.pk) for item in top) or '0',
+            'sync': current_token(),
+            'review': review.pk if review else 0,
+            'category': category.slug if category else '',
+        }
+
+    def url(self, scenario):
+        def fill(value):
+            return str(value).format(**self.samples)
+        url = reverse(f'places:{scenario.route}', kwargs={key: fill(value) for key, value in scenario.kwargs.items()})
+        return url, {key: fill(value) for key, value in scenario.params.items()}
+
+    def run(self, scenario):
+        url, params = self.url(scenario)
+        for _ in range(self.warmup):
+            self.client.get(url, params)
+        timings = []
+        queries = 0
+        status = 200
+        for _ in range(self.iterations):
+            # Reads may go to a replica, so count the queries of every connection
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(db)) for db in connections.all()]
+                start = time.perf_counter()
+                response = self.client.get(url, params)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, sum(len(context) for context in captured))
+            if response.status_code != 200:
+                status = response.status_code
+        query_string = '&'.join(f'{key}={value}' for key, value in params.items())
+        return Result(scenario, f'{url}?{query_string}' if query_string else url, status, queries, timings)
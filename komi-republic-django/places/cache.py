@@ -0,0 +1,122 @@
+"""
+Cache helpers for places app
+
+Cached data is keyed on generation counters stored in the shared cache.
+Bumping a generation makes every entry built from the old one unreachable,
+so invalidation works across all worker processes without deleting keys.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .replicas import pinned_to_primary, reading_from_replicas
+
+GENERATION_KEY = 'places:generation:{}'
+# Present for REPLICA_LAG_SECONDS after a bump, while replicas may still serve the old rows
+RECENT_BUMP_KEY = 'places:bumped:{}'
+RESPONSE_KEY = 'places:response:{}:{}'
+
+
+def get_generation(name):
+    """Return the current generation for name, creating it if missing"""
+    key = GENERATION_KEY.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never reuses an old value
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_generations(*names):
+    keys = [GENERATION_KEY.format(name) for name in names]
+    found = cache.get_many(keys)
+    return tuple(
+        found[key] if key in found else get_generation(name)
+        for name, key in zip(names, keys)
+    )
+
+
+def model_generation(model):
+    """Generation name bumped whenever a row of model changes"""
+    return f'model.{model._meta.label_lower}'
+
+
+def bump_generation(name):
+    """Invalidate everything cached under the current generation of name"""
+    key = GENERATION_KEY.format(name)
+    if settings.DATABASE_REPLICAS and settings.REPLICA_LAG_SECONDS:
+        cache.set(RECENT_BUMP_KEY.format(name), 1, timeout=settings.REPLICA_LAG_SECONDS)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+        return cache.get(key)
+
+
+def recently_bumped(*names):
+    """Whether any of the generations was bumped within REPLICA_LAG_SECONDS"""
+    return bool(cache.get_many([RECENT_BUMP_KEY.format(name) for name in names]))
+
+
+def response_cache_key(request, prefix, generations):
+    """Key a GET response on host, path, sorted query parameters and generations"""
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    raw = json.dumps(
+        [request.scheme, request.get_host(), request.path, params, generations],
+        separators=(',', ':'),
+        ensure_ascii=False,
+    )
+    return RESPONSE_KEY.format(prefix, hashlib.md5(raw.encode()).hexdigest())
+
+
+class CachedResponseMixin:
+    """
+    Serve read actions of a viewset from the cache.
+
+    Entries are keyed on the generations of ``cache_models``, which the
+    signal handlers bump on every save/delete, so a write makes stale
+    responses unreachable in every worker at once.
+    """
+    cache_models = ()
+    cached_actions = ('list', 'retrieve')
+
+    def cached_response(self, request, build):
+        timeout = settings.API_CACHE_TIMEOUT
+        if not timeout or request.method != 'GET':
+            return build()
+        if settings.DATABASE_REPLICAS and pinned_to_primary(request):
+            # Shared entries may hold replica reads from before this client's write
+            return build()
+        names = [model_generation(model) for model in self.cache_models]
+        key = response_cache_key(request, f'{self.basename}.{self.action}', get_generations(*names))
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = build()
+        # A replica may not have the rows of a fresh bump yet; caching its answer
+        # under the new generation would serve them stale until the next write
+        if response.status_code == 200 and not (reading_from_replicas() and recently_bumped(*names)):
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cached_actions:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cached_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,215 @@
+"""
+Map marker clustering for places app
+
+Clusters group published places by geohash prefix. Every precision level is
+computed in one pass over the place coordinates and cached until the
+``places.geo`` generation is bumped by a coordinate change.
+
+A committed bump schedules a rebuild of all categories in a background
+thread (``schedule_rebuild``); until it lands, requests get the clusters of
+the previous generation. Only a cache without any clusters builds them on the
+request path.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .cache import get_generation
+from .geo import GEOHASH_PRECISION
+from .models import Category, Place
+
+logger = logging.getLogger(__name__)
+
+GEO_GENERATION = 'places.geo'
+CLUSTERS_KEY = 'places:clusters:{generation}:{category}:{precision}'
+# All levels last built for a category, whatever their generation, served while a rebuild runs
+LATEST_KEY = 'places:clusters:latest:{category}'
+CATEGORIES_KEY = 'places:clusters:{generation}:categories'
+REBUILD_KEY = 'places:clusters:{generation}:rebuilding'
+MAX_ZOOM = 20
+SAMPLE_SIZE = 5
+# Seconds a rebuild waits for further writes to the same places
+REBUILD_DELAY = 1
+# Seconds other workers leave a generation's rebuild to the one that claimed it
+REBUILD_CLAIM_SECONDS = 60
+
+# Clusters built by this process, keyed by (generation, category, precision)
+_local_clusters = {}
+
+
+def zoom_precision(zoom):
+    """Geohash precision giving cells of roughly 1/8 of a map tile at zoom"""
+    return max(1, min(GEOHASH_PRECISION, round((zoom + 3) * 2 / 5)))
+
+
+def build_clusters(category=None):
+    """Compute clusters for every precision level, keyed by precision"""
+    queryset = Place.objects.filter(published=True).exclude(geohash='')
+    if category:
+        queryset = queryset.filter(category__slug=category)
+    rows = queryset.order_by('-rating', 'id').values_list('id', 'latitude', 'longitude', 'geohash')
+
+    cells = {precision: OrderedDict() for precision in range(1, GEOHASH_PRECISION + 1)}
+    for place_id, latitude, longitude, geohash in rows:
+        latitude = float(latitude)
+        longitude = float(longitude)
+        for precision, level in cells.items():
+            cell = level.get(geohash[:precision])
+            if cell is None:
+                cell = level[geohash[:precision]] = [0, 0.0, 0.0, []]
+            cell[0] += 1
+            cell[1] += latitude
+            cell[2] += longitude
+            if len(cell[3]) < SAMPLE_SIZE:
+                cell[3].append(place_id)
+
+    return {
+        precision: [
+            {
+                'geohash': geohash,
+                'count': count,
+                'latitude': round(lat_sum / count, 6),
+                'longitude': round(lon_sum / count, 6),
+                'place_ids': sample,
+            }
+            for geohash, (count, lat_sum, lon_sum, sample) in level.items()
+        ]
+        for precision, level in cells.items()
+    }
+
+
+def category_slugs():
+    """Slugs accepted by ?category=, cached until the next places.geo bump (category saves bump it)"""
+    key = CATEGORIES_KEY.format(generation=get_generation(GEO_GENERATION))
+    slugs = cache.get(key)
+    if slugs is None:
+        slugs = set(Category.objects.values_list('slug', flat=True))
+        cache.set(key, slugs)
+    return slugs
+
+
+def store_clusters(generation, category, levels):
+    cache.set_many({
+        LATEST_KEY.format(category=category): levels,
+        **{
+            CLUSTERS_KEY.format(generation=generation, category=category, precision=level): value
+            for level, value in levels.items()
+        },
+    })
+
+
+def rebuild_clusters():
+    """Build and cache the clusters of every category for the current generation"""
+    generation = get_generation(GEO_GENERATION)
+    for category in ['all', *sorted(category_slugs())]:
+        store_clusters(generation, category, build_clusters(None if category == 'all' else category))
+
+
+class ClusterRebuilder:
+    """Background thread running rebuild_clusters after places.geo bumps"""
+
+    def __init__(self, delay=REBUILD_DELAY):
+        self.delay = delay
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='cluster-rebuild', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.delay)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                rebuild_clusters()
+            except Exception:
+                logger.exception('Could not rebuild map clusters')
+
+
+_rebuilder = None
+_rebuilder_lock = threading.Lock()
+
+
+def claim_rebuild(generation):
+    """Schedule a rebuild for generation unless a worker has done so already"""
+    global _rebuilder
+    if not cache.add(REBUILD_KEY.format(generation=generation), 1, timeout=REBUILD_CLAIM_SECONDS):
+        return
+    if _rebuilder is None or not _rebuilder.thread.is_alive():
+        with _rebuilder_lock:
+            if _rebuilder is None or not _rebuilder.thread.is_alive():
+                _rebuilder = ClusterRebuilder()
+    _rebuilder.wakeup.set()
+
+
+def schedule_rebuild():
+    """Rebuild the clusters in the background; run once a places.geo bump is committed"""
+    claim_rebuild(get_generation(GEO_GENERATION))
+
+
+def get_clusters(zoom, category=None):
+    """Return precomputed clusters for a zoom level, or the previous ones while they are rebuilt"""
+    generation = get_generation(GEO_GENERATION)
+    category = category or 'all'
+    precision = zoom_precision(zoom)
+    local_key = (generation, category, precision)
+    clusters = _local_clusters.get(local_key)
+    if clusters is not None:
+        return clusters
+
+    key = CLUSTERS_KEY.format(generation=generation, category=category, precision=precision)
+    clusters = cache.get(key)
+    if clusters is None:
+        latest = cache.get(LATEST_KEY.format(category=category))
+        if latest is not None:
+            # Normally the writer's rebuild is on its way; this covers evictions and writers that exited
+            claim_rebuild(generation)
+            return latest[precision]
+        levels = build_clusters(None if category == 'all' else category)
+        store_clusters(generation, category, levels)
+        clusters = levels[precision]
+
+    for stale_key in [k for k in _local_clusters if k[0] != generation]:
+        del _local_clusters[stale_key]
+    _local_clusters[local_key] = clusters
+    return clusters
+
+
+def clusters_in_bbox(clusters, min_lon, min_lat, max_lon, max_lat):
+    """Filter clusters whose centroid lies inside the bounding box"""
+    crosses_antimeridian = min_lon > max_lon
+    for cluster in clusters:
+        if not min_lat <= cluster['latitude'] <= max_lat:
+            continue
+        longitude = cluster['longitude']
+        if crosses_antimeridian:
+            if longitude < min_lon and longitude > max_lon:
+                continue
+        elif not min_lon <= longitude <= max_lon:
+            continue
+        yield cluster
+
+
+def as_geojson(clusters):
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [cluster['longitude'], cluster['latitude']],
+                },
+                'properties': {
+                    'geohash': cluster['geohash'],
+                    'count': cluster['count'],
+                    'place_ids': cluster['place_ids'],
+                },
+            }
+            for cluster in clusters
+        ],
+    }
@@ -0,0 +1,108 @@
+"""
+Conditional GET support for places app viewsets
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_generations, model_generation, recently_bumped, response_cache_key
+from .replicas import pinned_to_primary, reading_from_replicas
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match / If-Modified-Since with 304 before serialization.
+
+    Validators come from one aggregate query: the row count and the latest
+    ``conditional_timestamps`` of the filtered queryset, or of the single
+    object on retrieve. With ``cache_models`` set they are cached under
+    the same generations as the response cache, so a repeat request costs
+    no query until one of those models is written.
+    """
+    conditional_actions = ('list', 'retrieve')
+    conditional_timestamps = ('updated_at',)
+
+    def get_conditional_timestamps(self):
+        return self.conditional_timestamps
+
+    def get_validators(self, request):
+        """Return (etag, last_modified) for the current request, or None if unknown"""
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = self.get_conditional_timestamps()
+        aggregates = {f'max_{index}': Max(field) for index, field in enumerate(fields)}
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+                values = queryset.aggregate(count=Count('pk'), **aggregates)
+            except (TypeError, ValueError, ValidationError):
+                # A malformed lookup value, e.g. /api/places/abc/: retrieve answers 404
+                return None
+        else:
+            values = queryset.aggregate(count=Count('pk'), **aggregates)
+        if self.action == 'retrieve' and not values['count']:
+            return None
+
+        timestamps = [values[f'max_{index}'] for index in range(len(fields))]
+        last_modified = max((ts for ts in timestamps if ts is not None), default=None)
+        params = sorted((key, sorted(items)) for key, items in request.query_params.lists())
+        raw = json.dumps(
+            [request.get_host(), request.path, params, values['count'],
+             [ts.isoformat() if ts else None for ts in timestamps]],
+            separators=(',', ':'),
+            ensure_ascii=False,
+        )
+        etag = '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+        # HTTP dates have one-second resolution
+        return etag, int(last_modified.timestamp()) if last_modified else None
+
+    def cached_validators(self, request):
+        """get_validators, served from the cache while the cache_models generations hold"""
+        timeout = settings.API_CACHE_TIMEOUT
+        models = getattr(self, 'cache_models', ())
+        if not timeout or not models or (settings.DATABASE_REPLICAS and pinned_to_primary(request)):
+            return self.get_validators(request)
+        names = [model_generation(model) for model in models]
+        key = response_cache_key(request, f'{self.basename}.{self.action}.validators', get_generations(*names))
+        cached = cache.get(key)
+        if cached is not None:
+            # An empty list stands for None, which the cache cannot tell from a miss
+            return tuple(cached) or None
+        validators = self.get_validators(request)
+        # Same rule as CachedResponseMixin: a lagging replica may predate a fresh bump
+        if not (reading_from_replicas() and recently_bumped(*names)):
+            cache.set(key, list(validators or ()), timeout)
+        return validators
+
+    def conditional_response(self, request, build):
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return build()
+        validators = self.cached_validators(request)
+        if validators is None:
+            return build()
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,22 @@
+"""
+Filter backends for places app
+"""
+from rest_framework import filters
+
+
+class RankedOrderingFilter(filters.OrderingFilter):
+    """
+    Ordering filter that sorts full-text matches by relevance.
+
+    When the queryset carries a ``search_rank`` annotation and the client did
+    not ask for an explicit ordering, the best matches come first and the
+    view's default ordering breaks ties.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get(self.ordering_param):
+            return super().get_ordering(request, queryset, view)
+        ordering = self.get_default_ordering(view) or []
+        if 'search_rank' in queryset.query.annotations:
+            return ['search_rank', *ordering]
+        return ordering
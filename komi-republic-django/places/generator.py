@@ -0,0 +1,288 @@
+"""
+Synthetic data generator for places app
+
+Produces load-test volumes of bilingual places around real Komi settlements,
+reviews and gallery images, inserted with ``bulk_create`` in batches, each
+batch in its own transaction. ``bulk_create`` sends no signals, so the
+search index, review aggregates, similar places and cache generations are
+brought up to date once at the end, along with the amenity index.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import amenities, clusters, search, similar
+from .aggregates import recompute_review_aggregates
+from .autocomplete import AUTOCOMPLETE_GENERATION
+from .cache import bump_generation, model_generation
+from .clusters import GEO_GENERATION
+from .geo import geohash_encode
+from .images import generate_variants
+from .models import Category, Place, PlaceAmenity, PlaceImage, Review, SimilarPlace, Tombstone
+
+# (name, name_ru, latitude, longitude) of settlements places are scattered around
+SETTLEMENTS = [
+    ('Syktyvkar', 'Сыктывкар', 61.6688, 50.8364),
+    ('Ukhta', 'Ухта', 63.5671, 53.6835),
+    ('Vorkuta', 'Воркута', 67.4974, 64.0612),
+    ('Pechora', 'Печора', 65.1481, 57.2244),
+    ('Inta', 'Инта', 66.0363, 60.1667),
+    ('Usinsk', 'Усинск', 65.9943, 57.5571),
+    ('Sosnogorsk', 'Сосногорск', 63.6012, 53.8763),
+    ('Vuktyl', 'Вуктыл', 63.8561, 57.3094),
+    ('Emva', 'Емва', 62.5905, 50.8733),
+    ('Mikun', 'Микунь', 62.3556, 50.0718),
+    ('Ust-Kulom', 'Усть-Кулом', 61.6866, 53.6907),
+    ('Troitsko-Pechorsk', 'Троицко-Печорск', 62.7085, 56.1964),
+    ('Izhma', 'Ижма', 65.0083, 53.9125),
+    ('Ust-Tsilma', 'Усть-Цильма', 65.4410, 52.1497),
+    ('Kortkeros', 'Корткерос', 61.8074, 51.5792),
+    ('Vizinga', 'Визинга', 61.0750, 50.1083),
+    ('Koygorodok', 'Койгородок', 60.4456, 50.9994),
+    ('Objachevo', 'Объячево', 60.3433, 49.6167),
+]
+# Bounding box of the republic, scattered coordinates are clamped to it
+LATITUDE_RANGE = (59.2, 68.4)
+LONGITUDE_RANGE = (45.4, 66.2)
+
+# (name, name_ru, category slug) of place kinds
+PLACE_KINDS = [
+    ('Lake', 'Озеро', 'nature'),
+    ('River Bank', 'Берег реки', 'nature'),
+    ('Waterfall', 'Водопад', 'nature'),
+    ('Rock', 'Скала', 'nature'),
+    ('Museum', 'Музей', 'museums'),
+    ('Local History Museum', 'Краеведческий музей', 'museums'),
+    ('Church', 'Церковь', 'architecture'),
+    ('Merchant House', 'Купеческий дом', 'architecture'),
+    ('Park', 'Парк', 'parks'),
+    ('Nature Trail', 'Экологическая тропа', 'parks'),
+    ('Folk Crafts Center', 'Центр народных ремёсел', 'cultural-sites'),
+    ('Monument', 'Памятник', 'cultural-sites'),
+]
+# (name, name_ru) pairs used to name places
+NAME_STEMS = [
+    ('Vychegda', 'Вычегда'), ('Pechora', 'Печора'), ('Sysola', 'Сысола'), ('Mezen', 'Мезень'),
+    ('Luza', 'Луза'), ('Vym', 'Вымь'), ('Shchugor', 'Щугор'), ('Kozhim', 'Кожим'), ('Ilych', 'Илыч'),
+    ('Parma', 'Парма'), ('Yugyd Va', 'Югыд Ва'), ('Ezhva', 'Эжва'), ('Sindor', 'Синдор'),
+    ('Timan', 'Тиман'), ('Zhemchuzhina', 'Жемчужина'), ('Severnaya', 'Северная'), ('Taiga', 'Тайга'),
+]
+CATEGORIES = [
+    {"name": "Nature", "name_ru": "Природа", "slug": "nature"},
+    {"name": "Museums", "name_ru": "Музеи", "slug": "museums"},
+    {"name": "Architecture", "name_ru": "Архитектура", "slug": "architecture"},
+    {"name": "Parks", "name_ru": "Парки", "slug": "parks"},
+    {"name": "Cultural Sites", "name_ru": "Культурные объекты", "slug": "cultural-sites"},
+]
+AUTHORS = [
+    'Анна', 'Иван', 'Мария', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Алексей',
+    'Anna', 'John', 'Maria', 'Peter', 'Laura', 'Tom',
+]
+COMMENTS = {
+    1: ['Не понравилось, дорога очень плохая.', 'Disappointing, hard to get to.'],
+    2: ['Ожидал большего.', 'Expected more for the trip.'],
+    3: ['Неплохо, но есть что улучшить.', 'Nice, but could be better organised.'],
+    4: ['Красивое место, рекомендую.', 'Beautiful place, worth the trip.'],
+    5: ['Незабываемые впечатления!', 'Absolutely stunning, a must see!'],
+}
+# Skewed towards good reviews, as real ones are
+RATING_WEIGHTS = [3, 5, 12, 35, 45]
+AMENITIES = ['parking', 'guided_tours', 'cafe', 'wifi', 'photography', 'hiking', 'camping', 'wheelchair_access']
+IMAGE_POOL_SIZE = 12
+
+
+class SyntheticDataGenerator:
+    """Bulk-insert synthetic categories, places, reviews and gallery images"""
+
+    def __init__(self, places, reviews, images_per_place=0, batch_size=5000, seed=0, using='default', log=None):
+        self.place_count = places
+        self.review_count = reviews
+        self.images_per_place = images_per_place
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.using = using
+        self.log = log or (lambda message: None)
+        self.image_pool = []
+
+    def run(self):
+        categories = self.create_categories()
+        if self.images_per_place:
+            self.image_pool = self.create_image_pool()
+        place_ids = self.timed('places', self.create_places, categories)
+        with transaction.atomic(using=self.using):
+            self.timed('amenity index', amenities.rebuild_index, Place, self.using, self.batch_size)
+        if self.review_count:
+            self.timed('reviews', self.create_reviews, place_ids)
+        if self.images_per_place:
+            self.timed('gallery images', self.create_gallery_images, place_ids)
+        self.finish()
+
+    def timed(self, label, func, *args):
+        start = time.monotonic()
+        result = func(*args)
+        self.log(f'{label}: done in {time.monotonic() - start:.1f}s')
+        return result
+
+    def batches(self, total):
+        """Sizes of consecutive batches covering total rows"""
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def create_categories(self):
+        categories = {}
+        for data in CATEGORIES:
+            category, _ = Category.objects.using(self.using).get_or_create(slug=data['slug'], defaults=data)
+            categories[category.slug] = category
+        return categories
+
+    def create_image_pool(self):
+        """A few stored images with variants that generated places and gallery rows share"""
+        pool = []
+        for index in range(IMAGE_POOL_SIZE):
+            field_file = PlaceImage(image=f'places/gallery/synthetic-{index}.jpg').image
+            if not field_file.storage.exists(field_file.name):
+                color = tuple(self.random.randint(40, 220) for _ in range(3))
+                buffer = BytesIO()
+                Image.new('RGB', (1600, 1067), color).save(buffer, 'JPEG', quality=85)
+                field_file.storage.save(field_file.name, ContentFile(buffer.getvalue()))
+            pool.append((field_file.name, generate_variants(field_file)))
+        return pool
+
+    def random_point(self, lat, lon):
+        """A point scattered around lat/lon"""
+        lat = min(max(self.random.gauss(lat, 0.35), LATITUDE_RANGE[0]), LATITUDE_RANGE[1])
+        lon = min(max(self.random.gauss(lon, 0.6), LONGITUDE_RANGE[0]), LONGITUDE_RANGE[1])
+        return Decimal(f'{lat:.6f}'), Decimal(f'{lon:.6f}')
+
+    def build_place(self, number, categories):
+        rng = self.random
+        kind, kind_ru, category_slug = rng.choice(PLACE_KINDS)
+        stem, stem_ru = rng.choice(NAME_STEMS)
+        settlement, settlement_ru, lat, lon = rng.choice(SETTLEMENTS)
+        latitude, longitude = self.random_point(lat, lon)
+        image, variants = rng.choice(self.image_pool) if self.image_pool else (None, {})
+        return Place(
+            name=f'{stem} {kind} #{number}',
+            name_ru=f'{kind_ru} «{stem_ru}» № {number}',
+            description=(
+                f'A {kind.lower()} near {settlement}, one of the sights of the Komi Republic. '
+                f'Visitors come here for the {stem} views and the northern nature.'
+            ),
+            description_ru=(
+                f'{kind_ru} недалеко от населённого пункта {settlement_ru} — одна из достопримечательностей '
+                f'Республики Коми. Сюда приезжают за видами и северной природой.'
+            ),
+            category=categories[category_slug],
+            rating=Decimal(rng.randint(30, 50)) / 10,
+            image=image,
+            image_variants=variants,
+            address=f'{settlement}, Komi Republic',
+            address_ru=f'{settlement_ru}, Республика Коми',
+            opening_hours='10:00-18:00' if category_slug in ('museums', 'cultural-sites') else '24/7',
+            opening_hours_ru='10:00-18:00' if category_slug in ('museums', 'cultural-sites') else 'Круглосуточно',
+            entry_fee='Free' if rng.random() < 0.6 else f'{rng.randint(1, 10) * 50} RUB',
+            entry_fee_ru='Бесплатно' if rng.random() < 0.6 else f'{rng.randint(1, 10) * 50} руб.',
+            latitude=latitude,
+            longitude=longitude,
+            # bulk_create skips Place.save()
+            geohash=geohash_encode(latitude, longitude),
+            amenities=rng.sample(AMENITIES, rng.randint(0, 4)),
+            is_open=rng.random() < 0.95,
+            published=rng.random() < 0.98,
+        )
+
+    def create_places(self, categories):
+        place_ids = []
+        start = Place.objects.using(self.using).count()
+        for size in self.batches(self.place_count):
+            batch = [self.build_place(start + len(place_ids) + offset + 1, categories) for offset in range(size)]
+            with transaction.atomic(using=self.using):
+                created = Place.objects.using(self.using).bulk_create(batch)
+            place_ids.extend(place.pk for place in created)
+            self.log(f'  places: {len(place_ids)}/{self.place_count}')
+        return place_ids
+
+    def create_reviews(self, place_ids):
+        rng = self.random
+        now = timezone.now()
+        done = 0
+        for size in self.batches(self.review_count):
+            batch = []
+            for _ in range(size):
+                rating = rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+                batch.append(Review(
+                    place_id=rng.choice(place_ids),
+                    author=rng.choice(AUTHORS),
+                    rating=rating,
+                    comment=rng.choice(COMMENTS[rating]),
+                    date=now - timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60)),
+                    published=rng.random() < 0.97,
+                ))
+            with transaction.atomic(using=self.using):
+                Review.objects.using(self.using).bulk_create(batch)
+            done += size
+            self.log(f'  reviews: {done}/{self.review_count}')
+
+    def create_gallery_images(self, place_ids):
+        rng = self.random
+        pending = []
+        done = 0
+        for place_id in place_ids:
+            for order in range(rng.randint(0, 2 * self.images_per_place)):
+                image, variants = rng.choice(self.image_pool)
+                pending.append(PlaceImage(
+                    place_id=place_id, image=image, image_variants=variants,
+                    caption=rng.choice(['', 'Вид сверху', 'Летом', 'Зимой']), order=order,
+                ))
+            if len(pending) >= self.batch_size:
+                done += self.insert_images(pending)
+                pending = []
+        if pending:
+            done += self.insert_images(pending)
+        self.log(f'  gallery images: {done}')
+
+    def insert_images(self, images):
+        with transaction.atomic(using=self.using):
+            PlaceImage.objects.using(self.using).bulk_create(images)
+        return len(images)
+
+    def finish(self):
+        """Do once what the skipped save signals would have done per row"""
+        connection = connections[self.using]
+        if connection.vendor == 'sqlite':
+            with transaction.atomic(using=self.using):
+                self.timed('search index', search.rebuild_index, Place, self.using, self.batch_size)
+        if self.review_count:
+            with transaction.atomic(using=self.using):
+                self.timed('review aggregates', recompute_review_aggregates, None, self.using, self.batch_size)
+        with transaction.atomic(using=self.using):
+            self.timed('similar places', similar.rebuild, self.using)
+        bump_all_generations()
+        # Rather than the first map request or a stale background build serving them
+        self.timed('map clusters', clusters.rebuild_clusters)
+
+
+def bump_all_generations():
+    for name in (GEO_GENERATION, AUTOCOMPLETE_GENERATION,
+                 *(model_generation(model) for model in (Category, Place, PlaceImage, Review, SimilarPlace))):
+        bump_generation(name)
+
+
+def clear_data(using='default'):
+    """Delete all rows of the app with plain DELETEs instead of loading every row to send signals"""
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for model in (SimilarPlace, PlaceAmenity, Review, PlaceImage, Place, Category):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        # One reset point instead of a tombstone per deleted row
+        Tombstone.objects.using(using).create(model=Tombstone.RESET, object_id=0)
+    bump_all_generations()
@@ -0,0 +1,98 @@
+"""
+Geospatial helpers for places app
+"""
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate pair into a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """Return (lat_degrees, lon_degrees) covered by a cell of given precision"""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def geohash_cover(latitude, longitude, radius_km):
+    """
+    Return geohash prefixes whose cells together cover a circle.
+
+    Picks the finest precision whose cell is at least as large as the radius
+    in both directions, so the centre cell plus its eight neighbours is
+    enough. An empty list means the circle is too large to narrow down.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    lat_span = radius_km / KM_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    lon_span = radius_km / (KM_PER_DEGREE * cos_lat)
+
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        lat_size, lon_size = geohash_cell_size(candidate)
+        if lat_size < lat_span or lon_size < lon_span:
+            break
+        precision = candidate
+    if precision == 0:
+        return []
+
+    lat_size, lon_size = geohash_cell_size(precision)
+    prefixes = set()
+    for dlat in (-1, 0, 1):
+        cell_lat = latitude + dlat * lat_size
+        if cell_lat > 90 or cell_lat < -90:
+            continue
+        for dlon in (-1, 0, 1):
+            cell_lon = (longitude + dlon * lon_size + 180) % 360 - 180
+            prefixes.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(prefixes)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
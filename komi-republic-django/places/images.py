@@ -0,0 +1,143 @@
+"""
+Responsive image variants for places app
+
+Uploaded images get resized WebP and JPEG copies stored next to the
+original (``places/images/lake.jpg`` -> ``places/images/lake.card.webp``).
+Their names and sizes are kept in a JSON field on the model and exposed to
+clients as ``srcset`` strings.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> longest side in pixels, smallest first
+IMAGE_VARIANTS = {
+    'thumbnail': 320,
+    'card': 800,
+    'full': 1600,
+}
+# Format key -> (Pillow format, file extension, save options)
+IMAGE_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, variant, format_key):
+    root, _ = posixpath.splitext(name)
+    return f'{root}.{variant}.{IMAGE_FORMATS[format_key][1]}'
+
+
+def variant_names(variants):
+    return {
+        name
+        for variant in (variants or {}).values()
+        for format_key in IMAGE_FORMATS
+        if (name := variant.get(format_key))
+    }
+
+
+def render_variants(source):
+    """Resize an open image to every variant size, skipping sizes the original cannot fill"""
+    source = ImageOps.exif_transpose(source)
+    has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+    source = source.convert('RGBA' if has_alpha else 'RGB')
+    rendered = {}
+    seen = set()
+    for variant, size in IMAGE_VARIANTS.items():
+        image = source.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if image.size in seen:
+            continue
+        seen.add(image.size)
+        files = {}
+        for format_key, (pil_format, _, options) in IMAGE_FORMATS.items():
+            output = image
+            if pil_format == 'JPEG' and has_alpha:
+                output = Image.new('RGB', image.size, (255, 255, 255))
+                output.paste(image, mask=image.getchannel('A'))
+            buffer = BytesIO()
+            output.save(buffer, pil_format, **options)
+            files[format_key] = buffer.getvalue()
+        rendered[variant] = (image.size, files)
+    return rendered
+
+
+def generate_variants(field_file):
+    """
+    Store resized copies of field_file and return their description.
+
+    Returns ``{variant: {'width', 'height', 'webp', 'jpeg'}}``, or an empty
+    dict when the file is missing or is not a readable image.
+    """
+    if not field_file:
+        return {}
+    storage = field_file.storage
+    try:
+        with storage.open(field_file.name, 'rb') as handle:
+            with Image.open(handle) as source:
+                rendered = render_variants(source)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Could not create variants for %s', field_file.name, exc_info=True)
+        return {}
+
+    variants = {}
+    for variant, ((width, height), files) in rendered.items():
+        variants[variant] = {'width': width, 'height': height}
+        for format_key, content in files.items():
+            name = variant_name(field_file.name, variant, format_key)
+            if storage.exists(name):
+                storage.delete(name)
+            variants[variant][format_key] = storage.save(name, ContentFile(content))
+    return variants
+
+
+def delete_variants(storage, variants, keep=()):
+    for name in variant_names(variants) - set(keep):
+        storage.delete(name)
+
+
+def refresh_variants(instance, field_name='image', variants_field='image_variants'):
+    """
+    Regenerate variants before saving instance if its image was uploaded or replaced.
+
+    The new upload is committed to storage first so the variants can be read
+    from it; Django skips committing it again in ``pre_save``. Returns True if
+    the variants field changed.
+    """
+    field_file = getattr(instance, field_name)
+    uploaded = bool(field_file) and not field_file._committed
+    if not uploaded and not instance.has_changed(field_name):
+        return False
+    if uploaded:
+        field_file.save(field_file.name, field_file.file, save=False)
+    rebuild_variants(instance, field_name, variants_field)
+    return True
+
+
+def rebuild_variants(instance, field_name='image', variants_field='image_variants'):
+    """Replace the variants of instance's image, removing files of the previous ones"""
+    field_file = getattr(instance, field_name)
+    old_variants = getattr(instance, variants_field) or {}
+    new_variants = generate_variants(field_file)
+    delete_variants(field_file.storage, old_variants, keep=variant_names(new_variants))
+    setattr(instance, variants_field, new_variants)
+    return new_variants
+
+
+def build_srcset(variants, url):
+    """``{format: 'url 320w, url 800w'}`` for the stored variants, or None without variants"""
+    if not variants:
+        return None
+    return {
+        format_key: ', '.join(
+            f'{url(variant[format_key])} {variant["width"]}w'
+            for variant in variants.values() if variant.get(format_key)
+        )
+        for format_key in IMAGE_FORMATS
+    }
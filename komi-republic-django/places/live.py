@@ -0,0 +1,204 @@
+"""
+Live review events for places app
+
+A ``Broker`` per worker process fans events out to the ``/api/live/``
+streams connected to that process. Events come from two feeds:
+
+* saves in the same process: the Review signal handlers and the review
+  write-behind queue call ``publish_changes`` once their transaction commits;
+* a relay thread that, while anyone is subscribed, reads reviews and places
+  changed in the last ``LIVE_POLL_INTERVAL`` seconds, so writes made by other
+  workers (gunicorn, the admin, commands) reach the stream too.
+
+Both feeds key events on the row and its ``updated_at``, and the broker drops
+keys it has already sent, so a change is delivered once. One relay query per
+worker replaces the ``/api/reviews/?place=`` polling of every open page.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Place, Review
+from .renderers import FastJSONRenderer
+from .serializers import PlaceRatingSerializer, ReviewSerializer
+
+logger = logging.getLogger(__name__)
+
+# Events waiting per stream before a slow client is disconnected (EventSource reconnects)
+MAX_QUEUED = 100
+# Event keys remembered for de-duplication
+SEEN_KEYS = 10000
+# Seconds each relay query reaches back before the previous one, for late commits
+POLL_OVERLAP = 5
+# Rows per relay query
+POLL_LIMIT = 500
+
+PLACE_FIELDS = ('category__slug', 'rating', 'review_count', 'review_avg', 'updated_at', 'published')
+
+
+def place_rows(queryset):
+    return queryset.select_related('category').only(*PLACE_FIELDS)
+
+
+def category_slug(place):
+    return place.category.slug if place.category_id else None
+
+
+def sse_message(kind, data):
+    return b'event: ' + kind.encode() + b'\ndata: ' + FastJSONRenderer().render(data) + b'\n\n'
+
+
+class Subscription:
+    """Events for one stream, filtered by place ids and/or category slug"""
+
+    def __init__(self, broker, places=(), category=None):
+        self.broker = broker
+        self.places = set(places)
+        self.category = category
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=MAX_QUEUED)
+        self.overflowed = False
+
+    def matches(self, place_id, category):
+        if self.places and place_id not in self.places:
+            return False
+        return not self.category or self.category == category
+
+    def deliver(self, message):
+        """Runs in the event loop of the stream"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Next message, or None after timeout seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    def __init__(self, poll_interval=2):
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.seen = OrderedDict()
+        self.relay = None
+
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def subscribe(self, places=(), category=None):
+        """Call from the event loop of the stream"""
+        subscription = Subscription(self, places, category)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if self.poll_interval and self.relay is None:
+                self.relay = threading.Thread(target=self.run_relay, name='live-relay', daemon=True)
+                self.relay.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, key, place_id, category, message):
+        """Send message to matching subscribers unless key was sent before; thread-safe"""
+        with self.lock:
+            if key in self.seen:
+                return
+            self.seen[key] = None
+            while len(self.seen) > SEEN_KEYS:
+                self.seen.popitem(last=False)
+            targets = [sub for sub in self.subscriptions if sub.matches(place_id, category)]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The stream's event loop is gone
+                self.unsubscribe(subscription)
+
+    def publish_reviews(self, reviews, categories):
+        """Publish published reviews; categories maps place ids to category slugs"""
+        for review in reviews:
+            category = categories.get(review.place_id)
+            data = {**ReviewSerializer(review).data, 'category': category}
+            self.publish(
+                ('review', review.pk, review.updated_at), review.place_id, category, sse_message('review', data),
+            )
+
+    def publish_places(self, places):
+        """Publish the ratings of places read with place_rows()"""
+        for place in places:
+            if not place.published:
+                continue
+            self.publish(
+                ('rating', place.pk, place.updated_at), place.pk, category_slug(place),
+                sse_message('rating', PlaceRatingSerializer(place).data),
+            )
+
+    def run_relay(self):
+        since = timezone.now()
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.has_subscribers():
+                since = timezone.now()
+                continue
+            started = timezone.now()
+            close_old_connections()
+            try:
+                self.relay_changes(since - datetime.timedelta(seconds=POLL_OVERLAP))
+            except Exception:
+                logger.exception('Could not read review changes for live streams')
+                continue
+            since = started
+
+    def relay_changes(self, since):
+        places = list(place_rows(Place.objects.filter(updated_at__gt=since).order_by('updated_at'))[:POLL_LIMIT])
+        reviews = list(
+            Review.objects.filter(published=True, updated_at__gt=since).order_by('updated_at')[:POLL_LIMIT]
+        )
+        categories = {place.pk: category_slug(place) for place in places}
+        missing = {review.place_id for review in reviews} - categories.keys()
+        if missing:
+            categories.update(Place.objects.filter(pk__in=missing).values_list('pk', 'category__slug'))
+        self.publish_reviews(reviews, categories)
+        self.publish_places(places)
+
+
+def publish_changes(review_ids=(), place_ids=(), using='default'):
+    """Publish saved reviews and the ratings of their places to this process's streams"""
+    broker = get_broker()
+    if not broker.has_subscribers():
+        return
+    places = list(place_rows(Place.objects.using(using).filter(pk__in=set(place_ids))))
+    reviews = Review.objects.using(using).filter(pk__in=list(review_ids), published=True)
+    broker.publish_reviews(reviews, {place.pk: category_slug(place) for place in places})
+    broker.publish_places(places)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None or _broker.pid != os.getpid():
+        with _broker_lock:
+            if _broker is None or _broker.pid != os.getpid():
+                _broker = Broker(settings.LIVE_POLL_INTERVAL)
+    return _broker
@@ -0,0 +1,89 @@
+"""
+Management command to benchmark API routes against query and latency budgets
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from places.benchmarks import SCENARIOS, BenchmarkRunner, uncovered_routes
+from places.generator import SyntheticDataGenerator
+
+ISOLATED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-api',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load synthetic data into a test database and measure latency, throughput and SQL queries '
+        'of every API route; fails when a budget is exceeded'
+    )
+
+    def add_arguments(self, parser):
+        # Per-row work (search ranking, distances) only shows up at production-like sizes
+        parser.add_argument('--places', type=int, default=20000, help='Synthetic places to generate')
+        parser.add_argument('--reviews', type=int, default=50000, help='Synthetic reviews to generate')
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per scenario')
+        parser.add_argument(
+            '--latency-factor', type=float, default=1.0,
+            help='Multiply p95 budgets, e.g. 2 on slow CI machines; query budgets are exact',
+        )
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help='Keep the API response cache on (off by default so every request hits the database)',
+        )
+        parser.add_argument('--only', action='append', default=[], help='Run only scenarios of this route name')
+
+    def handle(self, *args, **options):
+        missing = uncovered_routes()
+        if missing:
+            raise CommandError(f'Routes without benchmark scenarios: {", ".join(sorted(missing))}')
+
+        old_name = connection.settings_dict['NAME']
+        self.stdout.write('Creating test database...')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Replicas read the test database too, as in the test runner
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            # A private cache keeps test data out of the shared response cache; the data is
+            # seconds old, so /api/sync/ must not wait for it to settle
+            with override_settings(
+                CACHES=ISOLATED_CACHE, API_CACHE_TIMEOUT=300 if options['with_cache'] else 0, SYNC_SETTLE_SECONDS=0,
+            ):
+                self.stdout.write(f'Generating {options["places"]} places and {options["reviews"]} reviews...')
+                SyntheticDataGenerator(places=options['places'], reviews=options['reviews'], images_per_place=1).run()
+                failures = self.run_scenarios(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if failures:
+            raise CommandError(f'{failures} scenario(s) over budget')
+        self.stdout.write(self.style.SUCCESS('All scenarios within budget'))
+
+    def run_scenarios(self, options):
+        runner = BenchmarkRunner(iterations=options['iterations'], warmup=options['warmup'])
+        header = f'{"scenario":<28} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        failures = 0
+        for scenario in SCENARIOS:
+            if options['only'] and scenario.route not in options['only']:
+                continue
+            result = runner.run(scenario)
+            line = (
+                f'{scenario.label:<28} {result.queries:>7} {result.p50:>8.1f} {result.p95:>8.1f} '
+                f'{result.p99:>8.1f} {result.throughput:>8.0f}'
+            )
+            problems = result.failures(options['latency_factor'])
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'{line}  FAIL: {"; ".join(problems)} ({result.url})'))
+            else:
+                self.stdout.write(line)
+        return failures
@@ -0,0 +1,122 @@
+"""
+Management command to compare sync and async read endpoints of running servers under concurrency
+"""
+import http.client
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from places.benchmarks import BenchmarkRunner
+
+# (label, sync path, async path); {place} is the most reviewed published place
+ENDPOINTS = [
+    ('categories', '/api/categories/', '/api/async/categories/'),
+    ('places', '/api/places/', '/api/async/places/'),
+    ('places page 5', '/api/places/?page=5', '/api/async/places/?page=5'),
+    ('place detail', '/api/places/{place}/', '/api/async/places/{place}/'),
+    ('featured', '/api/places/featured/', '/api/async/places/featured/'),
+    ('place reviews', '/api/reviews/?place={place}', '/api/async/reviews/?place={place}'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Send concurrent GETs to the sync (/api/...) and async (/api/async/...) read endpoints of running '
+        'servers, e.g. gunicorn and uvicorn, and compare latency and throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sync-url', default='http://127.0.0.1:8000', help='Base URL of the server for the sync endpoints',
+        )
+        parser.add_argument(
+            '--async-url', default='http://127.0.0.1:8001', help='Base URL of the server for the async endpoints',
+        )
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent keep-alive connections')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and server')
+        parser.add_argument('--only', action='append', default=[], help='Run only endpoints with this label')
+
+    def handle(self, *args, **options):
+        samples = BenchmarkRunner.sample_values()
+        header = (
+            f'{"endpoint":<16} {"server":<6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}'
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        failed = 0
+        for label, sync_path, async_path in ENDPOINTS:
+            if options['only'] and label not in options['only']:
+                continue
+            for server, base_url, path in (
+                ('sync', options['sync_url'], sync_path), ('async', options['async_url'], async_path),
+            ):
+                result = self.load(base_url, path.format(**samples), options['concurrency'], options['requests'])
+                line = (
+                    f'{label:<16} {server:<6} {result["throughput"]:>8.0f} {result["p50"]:>8.1f} '
+                    f'{result["p95"]:>8.1f} {result["p99"]:>8.1f} {result["errors"]:>7}'
+                )
+                if result['errors']:
+                    failed += 1
+                    codes = ', '.join(f'{code}: {n}' for code, n in sorted(result['statuses'].items()))
+                    line = self.style.ERROR(f'{line}  ({codes})')
+                self.stdout.write(line)
+        if failed:
+            raise CommandError(f'{failed} run(s) with failed requests')
+
+    def load(self, base_url, path, concurrency, total):
+        """Spread total GETs of path over concurrency threads with one connection each"""
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise CommandError(f'Invalid server URL: {base_url}')
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        timings = []
+        statuses = Counter()
+        lock = threading.Lock()
+        remaining = iter(range(total))
+
+        def worker():
+            connection = connection_class(parts.hostname, parts.port, timeout=60)
+            local_timings, local_statuses = [], Counter()
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            break
+                    start = time.perf_counter()
+                    try:
+                        connection.request('GET', path)
+                        response = connection.getresponse()
+                        response.read()
+                        status = response.status
+                    except (OSError, http.client.HTTPException):
+                        connection.close()
+                        status = 0
+                    local_timings.append((time.perf_counter() - start) * 1000)
+                    local_statuses[status] += 1
+            finally:
+                connection.close()
+                with lock:
+                    timings.extend(local_timings)
+                    statuses.update(local_statuses)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(concurrency, total))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        timings.sort()
+        return {
+            'throughput': len(timings) / elapsed,
+            'p50': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95)],
+            'p99': timings[int(len(timings) * 0.99)],
+            'errors': sum(n for code, n in statuses.items() if code != 200),
+            'statuses': statuses,
+        }
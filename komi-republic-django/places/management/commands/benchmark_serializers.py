@@ -0,0 +1,122 @@
+"""
+Management command to benchmark list serialization of places
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from places.images import IMAGE_FORMATS, IMAGE_VARIANTS, variant_name
+from places.models import Category, Place
+from places.renderers import FastJSONRenderer
+from places.rows import RowSerializer
+from places.serializers import PlaceListSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare PlaceListSerializer + JSONRenderer with the values() row path + FastJSONRenderer '
+        'on generated places; the data is rolled back afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--places', type=int, default=10000, help='Number of places to generate')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path, the best one is reported')
+        parser.add_argument('--query', default='', help='Query string of the simulated request, e.g. "lang=ru"')
+        parser.add_argument('--host', default='localhost', help='Host of the simulated request')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.generate(options['places'])
+                self.compare(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def generate(self, count):
+        rng = random.Random(0)
+        categories = [
+            Category.objects.create(name=f'Benchmark {index}', name_ru=f'Тест {index}', slug=f'benchmark-{index}')
+            for index in range(5)
+        ]
+        places = []
+        for index in range(count):
+            places.append(Place(
+                name=f'Place {index}',
+                name_ru=f'Место «{index}» — ёлки',
+                description='Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 3,
+                description_ru='Описание места в Республике Коми.\nВторая строка .' * 3,
+                # Some places without a category, which drops category_* keys
+                category=rng.choice(categories) if index % 10 else None,
+                rating=Decimal(rng.randint(0, 50)) / 10,
+                image=self.image_name(index),
+                image_variants=self.image_variants(self.image_name(index)),
+                address=f'Street {index}',
+                address_ru=f'Улица {index}',
+                latitude=Decimal(rng.uniform(59, 68)).quantize(Decimal('0.000001')),
+                longitude=Decimal(rng.uniform(45, 66)).quantize(Decimal('0.000001')),
+            ))
+        Place.objects.bulk_create(places, batch_size=1000)
+
+    @staticmethod
+    def image_name(index):
+        if index % 3 == 0:
+            return None
+        # Mostly storage-safe names, a few that need quoting
+        return f'places/place_{index}.jpg' if index % 7 else f'places/место {index}.jpg'
+
+    @staticmethod
+    def image_variants(name):
+        if name is None:
+            return {}
+        return {
+            variant: {
+                'width': size, 'height': size * 2 // 3,
+                **{format_key: variant_name(name, variant, format_key) for format_key in IMAGE_FORMATS},
+            }
+            for variant, size in IMAGE_VARIANTS.items()
+        }
+
+    def compare(self, options):
+        factory = RequestFactory(HTTP_HOST=options['host'])
+        request = Request(factory.get(f'/api/places/?{options["query"]}'))
+        queryset = Place.objects.filter(published=True).select_related('category').order_by('-rating', 'name_ru', 'id')
+
+        def regular():
+            serializer = PlaceListSerializer(queryset.all(), many=True, context={'request': request})
+            return JSONRenderer().render(serializer.data)
+
+        def fast():
+            row_serializer = RowSerializer(PlaceListSerializer(context={'request': request}))
+            rows = row_serializer.values(queryset.all(), {'rating', 'name_ru', 'id'})
+            return FastJSONRenderer().render(row_serializer.to_representation(rows))
+
+        regular_time, regular_output = self.measure(regular, options['repeat'])
+        fast_time, fast_output = self.measure(fast, options['repeat'])
+        if regular_output != fast_output:
+            raise CommandError('Outputs differ')
+
+        self.stdout.write(f'{options["places"]} places, {len(fast_output)} bytes, outputs identical')
+        self.stdout.write(f'  serializer + JSONRenderer:   {regular_time * 1000:8.1f} ms')
+        self.stdout.write(f'  values() + FastJSONRenderer: {fast_time * 1000:8.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {regular_time / fast_time:.1f}x'))
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
@@ -0,0 +1,22 @@
+"""
+Management command to recompute the similar places of every place
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from places import similar
+
+
+class Command(BaseCommand):
+    help = 'Recompute the nearest neighbours shown by /api/places/{id}/similar/ for all published places'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--block-rows', type=int, default=similar.BLOCK_ROWS, help='Places scored against all others at a time',
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            count = similar.rebuild(using=options['database'], block_rows=options['block_rows'])
+        self.stdout.write(self.style.SUCCESS(f'Computed similar places for {count} places'))
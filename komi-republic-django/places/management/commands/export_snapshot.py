@@ -0,0 +1,28 @@
+"""
+Management command to export the public API as precompressed static files
+"""
+from django.core.management.base import BaseCommand
+
+from places.snapshot import SnapshotExporter, brotli
+
+
+class Command(BaseCommand):
+    help = 'Export categories, place lists, place details and reviews as JSON files with .gz/.br variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Output directory, e.g. the nginx snapshot root')
+        parser.add_argument(
+            '--base-url', default='http://localhost',
+            help='Public scheme and host used in absolute links; the host must be in ALLOWED_HOSTS',
+        )
+        parser.add_argument('--full', action='store_true', help='Ignore the manifest and re-render everything')
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stdout.write('brotli is not installed, writing only .gz variants')
+        exporter = SnapshotExporter(options['directory'], base_url=options['base_url'], full=options['full'])
+        stats = exporter.export()
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshot exported: {stats["written"]} written, {stats["unchanged"]} unchanged, '
+            f'{stats["removed"]} removed'
+        ))
@@ -0,0 +1,31 @@
+"""
+Management command to create responsive variants for existing images
+"""
+from django.core.management.base import BaseCommand
+
+from places.images import rebuild_variants
+from places.models import Place, PlaceImage
+
+
+class Command(BaseCommand):
+    help = 'Create resized WebP/JPEG variants for place images uploaded before variants existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        for model, update_fields in ((Place, ['image_variants', 'updated_at']), (PlaceImage, ['image_variants'])):
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True).order_by('pk')
+            if not options['force']:
+                queryset = queryset.filter(image_variants={})
+            done = failed = 0
+            for instance in queryset.iterator():
+                if rebuild_variants(instance):
+                    done += 1
+                else:
+                    failed += 1
+                # Saving fires the usual signals, so cached responses and ETags move on
+                instance.save(update_fields=update_fields)
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: {done} processed, {failed} unreadable or missing'
+            ))
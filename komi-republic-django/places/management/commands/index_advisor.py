@@ -0,0 +1,52 @@
+"""
+Management command to report full scans and temporary sorts in API query plans
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from places.benchmarks import SCENARIOS
+from places.query_plans import QueryPlanAdvisor
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every API benchmark scenario, EXPLAIN the SQL it runs and report full table scans '
+        'and temporary B-tree sorts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every statement')
+        parser.add_argument(
+            '--min-rows', type=int, default=1000, help='Ignore full scans of tables with fewer rows',
+        )
+        parser.add_argument('--only', action='append', default=[], help='Check only scenarios of this route name')
+        parser.add_argument(
+            '--fail-on-issues', action='store_true', help='Exit with an error when any statement has an issue',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scenarios = [
+                scenario for scenario in SCENARIOS if not options['only'] or scenario.route in options['only']
+            ]
+            reports = QueryPlanAdvisor(scenarios, min_rows=options['min_rows']).run()
+        except NotImplementedError as exc:
+            raise CommandError(str(exc))
+
+        found = 0
+        for report in reports:
+            issues = report.issues
+            found += len(issues)
+            status = self.style.WARNING(f'{len(issues)} issue(s)') if issues else self.style.SUCCESS('ok')
+            self.stdout.write(f'{report.scenario.label} ({report.url}): {len(report.statements)} statement(s), {status}')
+            for statement in report.statements:
+                if not statement.issues and not options['verbose_plans']:
+                    continue
+                self.stdout.write(f'  {statement.sql}')
+                if statement.params:
+                    self.stdout.write(f'    params: {statement.params!r}')
+                for line in statement.plan if options['verbose_plans'] else statement.issues:
+                    self.stdout.write(f'    {line}')
+
+        if found and options['fail_on_issues']:
+            raise CommandError(f'{found} query plan issue(s)')
+        self.stdout.write(f'{found} query plan issue(s) in {len(reports)} scenario(s)')
@@ -0,0 +1,30 @@
+"""
+Management command to delete sync tombstones older than SYNC_TOMBSTONE_DAYS
+"""
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from places.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete tombstones of deleted rows older than SYNC_TOMBSTONE_DAYS; '
+        'clients with older sync tokens get a full download instead'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only count the tombstones to delete')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        old = Tombstone.objects.using(options['database']).filter(deleted_at__lt=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f'{old.count()} tombstone(s) older than {settings.SYNC_TOMBSTONE_DAYS} days')
+            return
+        deleted, _ = old.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstone(s) older than {settings.SYNC_TOMBSTONE_DAYS} days'))
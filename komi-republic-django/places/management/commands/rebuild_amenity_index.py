@@ -0,0 +1,21 @@
+"""
+Management command to rebuild the amenity index behind the ?amenities= filters
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from places import amenities
+from places.models import Place
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the amenity index of places from Place.amenities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            count = amenities.rebuild_index(Place, using=options['database'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} place amenities'))
@@ -0,0 +1,26 @@
+"""
+Management command to rebuild the full-text search index for places
+"""
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from places import search
+from places.models import Place
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for places'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f'{connection.vendor} maintains the search index itself, nothing to do')
+            return
+        with transaction.atomic(using=using):
+            search.create_index(connection)
+            count = search.rebuild_index(Place, using=using)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} places'))
@@ -0,0 +1,31 @@
+"""
+Management command to recompute review aggregates stored on places
+"""
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from places.aggregates import recompute_review_aggregates
+from places.cache import bump_generation, model_generation
+from places.models import Place
+
+
+class Command(BaseCommand):
+    help = 'Recompute review count, average and per-star counts for places'
+
+    def add_arguments(self, parser):
+        parser.add_argument('place_ids', nargs='*', type=int, help='Only recompute these places')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            count = recompute_review_aggregates(
+                place_ids=options['place_ids'] or None,
+                using=options['database'],
+                batch_size=options['batch_size'],
+            )
+            # Cached place responses carry the old counters
+            transaction.on_commit(partial(bump_generation, model_generation(Place)), using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed review aggregates, {count} places changed'))
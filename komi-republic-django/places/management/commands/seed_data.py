@@ -2,38 +2,72 @@
 Management command to seed the database with initial data
 """
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime
+from places.generator import CATEGORIES, SyntheticDataGenerator, clear_data
 from places.models import Category, Place, Review
 
 
 class Command(BaseCommand):
     help = 'Seed database with initial data for Komi Republic attractions'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generate', action='store_true',
+            help='Generate synthetic data in bulk instead of loading the curated attractions',
+        )
+        parser.add_argument('--places', type=int, default=1000, help='Places to generate')
+        parser.add_argument('--reviews', type=int, default=10000, help='Reviews to generate')
+        parser.add_argument('--images', type=int, default=0, help='Average gallery images per generated place')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert and transaction')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible data')
+        parser.add_argument('--keep', action='store_true', help='Add generated data without clearing existing rows')
+
     def handle(self, *args, **kwargs):
+        if kwargs['generate']:
+            self.generate(kwargs)
+            return
+
         self.stdout.write('Seeding database...')
         
         # Clear existing data
         self.stdout.write('Clearing existing data...')
-        Review.objects.all().delete()
-        Place.objects.all().delete()
-        Category.objects.all().delete()
+        clear_data()
         
+        with transaction.atomic():
+            self.load_curated()
+
+        self.stdout.write(self.style.SUCCESS('Database seeded successfully!'))
+        self.stdout.write(f'Created {Category.objects.count()} categories')
+        self.stdout.write(f'Created {Place.objects.count()} places')
+        self.stdout.write(f'Created {Review.objects.count()} reviews')
+
+    def generate(self, options):
+        if not options['keep']:
+            self.stdout.write('Clearing existing data...')
+            clear_data()
+        self.stdout.write(
+            f'Generating {options["places"]} places, {options["reviews"]} reviews '
+            f'and ~{options["images"]} gallery images per place...'
+        )
+        SyntheticDataGenerator(
+            places=options['places'],
+            reviews=options['reviews'],
+            images_per_place=options['images'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        ).run()
+        self.stdout.write(self.style.SUCCESS('Database seeded successfully!'))
+
+    def load_curated(self):
         # Create categories
         self.stdout.write('Creating categories...')
-        categories_data = [
-            {"name": "Nature", "name_ru": "Природа", "slug": "nature"},
-            {"name": "Museums", "name_ru": "Музеи", "slug": "museums"},
-            {"name": "Architecture", "name_ru": "Архитектура", "slug": "architecture"},
-            {"name": "Parks", "name_ru": "Парки", "slug": "parks"},
-            {"name": "Cultural Sites", "name_ru": "Культурные объекты", "slug": "cultural-sites"},
-        ]
-        
         categories = {}
-        for cat_data in categories_data:
+        for cat_data in CATEGORIES:
             category = Category.objects.create(**cat_data)
             categories[cat_data['slug']] = category
-            self.stdout.write(f'  Created category: {category.name_ru}')
         
         # Create places
         self.stdout.write('Creating places...')
@@ -218,7 +252,6 @@ class Command(BaseCommand):
                 **place_data
             )
             places.append(place)
-            self.stdout.write(f'  Created place: {place.name_ru}')
         
         # Create reviews
         self.stdout.write('Creating reviews...')
@@ -314,14 +347,8 @@ class Command(BaseCommand):
             date_str = review_data.pop('date')
             date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
             
-            review = Review.objects.create(
+            Review.objects.create(
                 place=places[place_index],
                 date=date_obj,
                 **review_data
             )
-            self.stdout.write(f'  Created review by {review.author} for {review.place.name_ru}')
-        
-        self.stdout.write(self.style.SUCCESS('Database seeded successfully!'))
-        self.stdout.write(f'Created {Category.objects.count()} categories')
-        self.stdout.write(f'Created {Place.objects.count()} places')
-        self.stdout.write(f'Created {Review.objects.count()} reviews')
@@ -0,0 +1,157 @@
+"""
+Management command to post reviews concurrently and report lock errors
+"""
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test import Client
+from django.utils import timezone
+
+from places.aggregates import STAR_FIELDS
+from places.models import Place, Review
+from places.write_behind import get_review_queue
+
+AUTHOR = 'stress-test'
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer POST /api/reviews/ from concurrent threads, in process or against a running server, '
+        'then check that every accepted review and the place aggregates were stored'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=200, help='Reviews posted per client')
+        parser.add_argument('--places', type=int, default=20, help='Number of places the reviews go to')
+        parser.add_argument(
+            '--url', default='',
+            help='Base URL of a running server, e.g. http://127.0.0.1:8000 (default: in-process test client)',
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the posted reviews')
+
+    def handle(self, *args, **options):
+        place_ids = list(
+            Place.objects.filter(published=True).order_by('?').values_list('pk', flat=True)[:options['places']]
+        )
+        if not place_ids:
+            raise CommandError('No published places, run seed_data first')
+        Review.objects.filter(author=AUTHOR).delete()
+
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.timings = []
+        self.lock = threading.Lock()
+        post = self.http_post(options['url']) if options['url'] else self.client_post
+
+        threads = [
+            threading.Thread(target=self.worker, args=(post, place_ids, options['requests'], seed))
+            for seed in range(options['threads'])
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.report(elapsed)
+        try:
+            self.verify(options['url'], place_ids)
+        finally:
+            if not options['keep']:
+                Review.objects.filter(author=AUTHOR).delete()
+
+    def worker(self, post, place_ids, count, seed):
+        rng = random.Random(seed)
+        try:
+            for index in range(count):
+                payload = {
+                    'place': rng.choice(place_ids),
+                    'author': AUTHOR,
+                    'rating': rng.randint(1, 5),
+                    'comment': f'Stress review {seed}-{index}',
+                    'date': timezone.now().isoformat(),
+                }
+                start = time.perf_counter()
+                try:
+                    status = post(payload)
+                    error = None
+                except OperationalError as exc:
+                    status, error = 500, str(exc)
+                duration = (time.perf_counter() - start) * 1000
+                with self.lock:
+                    self.statuses[status] += 1
+                    self.timings.append(duration)
+                    if error:
+                        self.errors[error] += 1
+        finally:
+            connections.close_all()
+
+    def client_post(self, payload):
+        client = Client(HTTP_HOST='localhost')
+        return client.post('/api/reviews/', payload, content_type='application/json').status_code
+
+    def http_post(self, base_url):
+        def post(payload):
+            request = Request(
+                base_url.rstrip('/') + '/api/reviews/',
+                data=json.dumps(payload).encode(),
+                headers={'Content-Type': 'application/json'},
+                method='POST',
+            )
+            try:
+                with urlopen(request, timeout=60) as response:
+                    return response.status
+            except HTTPError as exc:
+                if exc.code >= 500:
+                    with self.lock:
+                        self.errors[exc.read(200).decode(errors='replace').strip() or str(exc)] += 1
+                return exc.code
+            except URLError as exc:
+                with self.lock:
+                    self.errors[str(exc.reason)] += 1
+                return 0
+        return post
+
+    def report(self, elapsed):
+        total = sum(self.statuses.values())
+        ordered = sorted(self.timings)
+        self.stdout.write(
+            f'{total} requests in {elapsed:.1f} s ({total / elapsed:.0f} req/s), '
+            f'p50 {statistics.median(ordered):.1f} ms, p95 {ordered[int(len(ordered) * 0.95)]:.1f} ms, '
+            f'max {ordered[-1]:.1f} ms'
+        )
+        self.stdout.write('Status codes: ' + ', '.join(f'{code}: {n}' for code, n in sorted(self.statuses.items())))
+        for error, count in self.errors.most_common(5):
+            self.stdout.write(self.style.ERROR(f'{count} x {error}'))
+
+    def verify(self, url, place_ids):
+        if not url and settings.REVIEW_WRITE_BEHIND:
+            get_review_queue().flush()
+        elif url:
+            # A server with write-behind flushes on its own schedule
+            time.sleep(settings.REVIEW_FLUSH_INTERVAL + 1)
+
+        accepted = self.statuses[201] + self.statuses[202]
+        stored = Review.objects.filter(author=AUTHOR).count()
+        mismatched = 0
+        for place in Place.objects.filter(pk__in=place_ids):
+            counts = Counter(
+                Review.objects.filter(place=place, published=True).values_list('rating', flat=True)
+            )
+            if any(getattr(place, field) != counts[star] for star, field in STAR_FIELDS.items()):
+                mismatched += 1
+        message = f'{stored} of {accepted} accepted reviews stored, {mismatched} place(s) with wrong aggregates'
+        if stored != accepted or mismatched or self.errors:
+            raise CommandError(message)
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,361 @@
+"""
+Prometheus metrics for places app
+
+Each worker process counts requests in memory and writes its totals to
+``METRICS_DIR/metrics-<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL``
+seconds. The ``/metrics`` view adds up the files of all workers, so the
+numbers cover every gunicorn worker no matter which one answers the scrape.
+
+A worker that starts with the pid of an earlier one continues from that
+file's totals, so counters never go backwards when the service restarts.
+Files of workers that are no longer running are folded into
+``metrics-archive.json`` on scrape instead of piling up one per pid.
+"""
+import ipaddress
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FILE_RE = re.compile(r'^metrics-(\d+|archive)\.json$')
+ARCHIVE_NAME = 'metrics-archive.json'
+LOCK_NAME = '.metrics.lock'
+
+# Histogram name -> upper bucket bounds
+HISTOGRAMS = {
+    'api_request_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'api_db_duration_seconds': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    'api_db_queries': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+}
+HELP = {
+    'api_requests_total': ('counter', 'Requests by route, method and status class'),
+    'api_cache_responses_total': ('counter', 'Cached API responses by route and result (X-Cache header)'),
+    'api_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'api_db_duration_seconds': ('histogram', 'Time spent in SQL per request by route'),
+    'api_db_queries': ('histogram', 'SQL queries per request by route'),
+}
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def read_metrics(path):
+    """(counters, histograms) saved in path, empty for a missing or unreadable file"""
+    counters, histograms = {}, {}
+    try:
+        data = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return counters, histograms
+    for name, labels, value in data.get('counters', []):
+        counters[name, tuple(map(tuple, labels))] = value
+    for name, labels, buckets, total, count in data.get('histograms', []):
+        if name in HISTOGRAMS and len(buckets) == len(HISTOGRAMS[name]) + 1:
+            histograms[name, tuple(map(tuple, labels))] = [buckets, total, count]
+    return counters, histograms
+
+
+def dump_metrics(counters, histograms):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [
+            [name, labels, list(buckets), total, count]
+            for (name, labels), (buckets, total, count) in histograms.items()
+        ],
+    }
+
+
+def write_metrics(path, data):
+    """Replace path with data in one rename, so readers never see half a file"""
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.metrics-')
+    try:
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(data, handle, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def merge_metrics(counters, histograms, part_counters, part_histograms):
+    """Add part_counters and part_histograms into counters and histograms"""
+    for key, value in part_counters.items():
+        counters[key] = counters.get(key, 0) + value
+    for key, (buckets, value_sum, count) in part_histograms.items():
+        merged = histograms.setdefault(key, [[0] * len(buckets), 0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += value_sum
+        merged[2] += count
+
+
+@contextmanager
+def locked(directory, shared=False):
+    """Hold the lock of directory, shared for reading the files or exclusive for archiving them"""
+    if fcntl is None:
+        yield
+        return
+    with open(directory / LOCK_NAME, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        return True
+    return True
+
+
+class MetricsStore:
+    """Counters and histograms of this process, mirrored to a file in directory"""
+
+    def __init__(self, directory, flush_interval=5):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.path = self.directory / f'metrics-{self.pid}.json'
+        self.lock = threading.Lock()
+        self.timer = None
+        self.counters, self.histograms = read_metrics(self.path)
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.schedule_flush()
+
+    def observe(self, name, labels, value):
+        bounds = HISTOGRAMS[name]
+        key = (name, labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(bounds) + 1), 0, 0]
+            index = next((i for i, bound in enumerate(bounds) if value <= bound), len(bounds))
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        """Write the file within flush_interval of the first unsaved change"""
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_interval, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def snapshot(self):
+        with self.lock:
+            self.timer = None
+            return dump_metrics(self.counters, self.histograms)
+
+    def flush(self):
+        data = self.snapshot()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            write_metrics(self.path, data)
+        except OSError:
+            logger.warning('Could not write metrics to %s', self.directory, exc_info=True)
+
+
+def archive_exited_workers(directory):
+    """
+    Fold the files of workers that are no longer running into the archive
+    file and delete them; returns the number of files archived. Their totals
+    stay in the sum, so counters do not drop when workers are recycled.
+    """
+    directory = Path(directory)
+    if fcntl is None or not directory.is_dir():
+        return 0
+    with locked(directory):
+        exited = [
+            path for path in directory.iterdir()
+            if FILE_RE.match(path.name) and path.name != ARCHIVE_NAME
+            and not process_running(int(path.name[len('metrics-'):-len('.json')]))
+        ]
+        if not exited:
+            return 0
+        archive = directory / ARCHIVE_NAME
+        counters, histograms = read_metrics(archive)
+        for path in exited:
+            merge_metrics(counters, histograms, *read_metrics(path))
+        write_metrics(archive, dump_metrics(counters, histograms))
+        for path in exited:
+            path.unlink(missing_ok=True)
+    return len(exited)
+
+
+def collect(directory):
+    """Sum the (counters, histograms) files of all workers in directory"""
+    counters, histograms = {}, {}
+    directory = Path(directory)
+    if not directory.is_dir():
+        return counters, histograms
+    # Shared with other scrapes, but not with archiving, which would show up as a counter reset
+    with locked(directory, shared=True):
+        for path in directory.iterdir():
+            if FILE_RE.match(path.name):
+                merge_metrics(counters, histograms, *read_metrics(path))
+    return counters, histograms
+
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(counters, histograms):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+            continue
+        bounds = HISTOGRAMS[name]
+        for (metric, labels), (buckets, value_sum, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip([*bounds, '+Inf'], buckets):
+                cumulative += bucket
+                le = bound if bound == '+Inf' else format_value(float(bound))
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(float(value_sum))}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None or _store.pid != os.getpid():
+        with _store_lock:
+            if _store is None or _store.pid != os.getpid():
+                _store = MetricsStore(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+    return _store
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Count requests per route (``places:place-list``, ``places:place-nearby``...).
+
+    Goes above ``ServerTimingMiddleware`` in ``MIDDLEWARE`` to reuse its SQL
+    measurements from ``request.timings``.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, time.perf_counter() - start)
+
+    @staticmethod
+    def record(request, response, duration):
+        if not settings.METRICS_ENABLED or request.path == '/metrics':
+            return response
+
+        store = get_store()
+        route = {'route': route_name(request)}
+        store.inc('api_requests_total', {
+            **route, 'method': request.method, 'status': f'{response.status_code // 100}xx',
+        })
+        store.observe('api_request_duration_seconds', route, duration)
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            store.observe('api_db_duration_seconds', route, timings.db_ms / 1000)
+            store.observe('api_db_queries', route, len(timings.queries))
+        cache_result = response.get('X-Cache')
+        if cache_result:
+            store.inc('api_cache_responses_total', {**route, 'result': cache_result.lower()})
+        return response
+
+
+def metrics_allowed(request):
+    """
+    Scrapes need ``Authorization: Bearer <METRICS_TOKEN>``, or come straight
+    to gunicorn from a loopback address when no token is configured.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        return request.headers.get('Authorization') == f'Bearer {token}'
+    # nginx sets X-Real-IP/X-Forwarded-For on proxied requests
+    if 'X-Real-IP' in request.headers or 'X-Forwarded-For' in request.headers:
+        return False
+    try:
+        return ipaddress.ip_address(request.META.get('REMOTE_ADDR', '')).is_loopback
+    except ValueError:
+        return False
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    if settings.METRICS_ENABLED:
+        get_store().flush()
+    try:
+        archive_exited_workers(settings.METRICS_DIR)
+    except OSError:
+        logger.warning('Could not archive metrics in %s', settings.METRICS_DIR, exc_info=True)
+    return HttpResponse(
+        render_prometheus(*collect(settings.METRICS_DIR)),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+from places.geo import geohash_encode
+
+
+def populate_geohash(apps, schema_editor):
+    Place = apps.get_model('places', 'Place')
+    places = Place.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for place in places.iterator():
+        place.geohash = geohash_encode(place.latitude, place.longitude)
+        place.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='Геохеш'),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:02
+
+from django.db import migrations
+
+from places import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_index(schema_editor.connection)
+    search.rebuild_index(apps.get_model('places', 'Place'), using=schema_editor.connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0002_place_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
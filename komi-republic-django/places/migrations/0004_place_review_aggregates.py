@@ -0,0 +1,59 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+from places.aggregates import recompute_review_aggregates
+
+
+def populate_review_aggregates(apps, schema_editor):
+    recompute_review_aggregates(
+        using=schema_editor.connection.alias,
+        place_model=apps.get_model('places', 'Place'),
+        review_model=apps.get_model('places', 'Review'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0003_place_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='review_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='Средняя оценка отзывов'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='review_count_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отзывов на 1'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='review_count_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отзывов на 2'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='review_count_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отзывов на 3'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='review_count_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отзывов на 4'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='review_count_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отзывов на 5'),
+        ),
+        migrations.RunPython(populate_review_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0004_place_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddField(
+            model_name='placeimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(condition=models.Q(('published', True)), fields=['-rating', 'name_ru'], name='place_published_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(condition=models.Q(('published', True)), fields=['category', '-rating', 'name_ru'], name='place_category_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(condition=models.Q(('published', True)), fields=['category', 'updated_at'], name='place_published_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='placeimage',
+            index=models.Index(fields=['place', 'order', 'created_at'], name='placeimage_place_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('published', True)), fields=['-date'], name='review_published_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('published', True)), fields=['place', '-date'], name='review_place_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('published', True)), fields=['updated_at'], name='review_published_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0006_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('category', 'Категория'), ('place', 'Место'), ('placeimage', 'Изображение места'), ('review', 'Отзыв')], max_length=20, verbose_name='Модель')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID объекта')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Удалено')),
+            ],
+            options={
+                'verbose_name': 'Удалённый объект',
+                'verbose_name_plural': 'Удалённые объекты',
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='placeimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Обновлено'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['updated_at'], name='category_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(fields=['updated_at'], name='place_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='placeimage',
+            index=models.Index(fields=['updated_at'], name='placeimage_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['updated_at'], name='review_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ),
+    ]
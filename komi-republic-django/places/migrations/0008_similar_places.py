@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from places import similar
+
+
+def compute_similar_places(apps, schema_editor):
+    similar.rebuild(
+        schema_editor.connection.alias,
+        place_model=apps.get_model('places', 'Place'),
+        similar_model=apps.get_model('places', 'SimilarPlace'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0007_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarPlace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Позиция')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('place', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='similar_places', to='places.place', verbose_name='Место')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_for', to='places.place', verbose_name='Похожее место')),
+            ],
+            options={
+                'verbose_name': 'Похожее место',
+                'verbose_name_plural': 'Похожие места',
+                'ordering': ['place', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('place', 'rank'), name='similarplace_place_rank_uniq')],
+            },
+        ),
+        migrations.RunPython(compute_similar_places, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from places import amenities
+
+
+def fill_amenity_index(apps, schema_editor):
+    amenities.rebuild_index(
+        apps.get_model('places', 'Place'),
+        using=schema_editor.connection.alias,
+        amenity_model=apps.get_model('places', 'PlaceAmenity'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0008_similar_places'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amenity', models.CharField(max_length=100, verbose_name='Удобство')),
+                ('place', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amenity_entries', to='places.place', verbose_name='Место')),
+            ],
+            options={
+                'verbose_name': 'Удобство места',
+                'verbose_name_plural': 'Удобства мест',
+                'ordering': ['amenity', 'place'],
+                'constraints': [models.UniqueConstraint(fields=('amenity', 'place'), name='placeamenity_amenity_place_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_amenity_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0009_place_amenities'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tombstone',
+            name='model',
+            field=models.CharField(choices=[('category', 'Категория'), ('place', 'Место'), ('placeimage', 'Изображение места'), ('review', 'Отзыв'), ('reset', 'Все данные')], max_length=20, verbose_name='Модель'),
+        ),
+    ]
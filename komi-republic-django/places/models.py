@@ -2,7 +2,55 @@
 Models for Komi Republic tourist attractions
 """
 from django.db import models
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .geo import geohash_encode
+from .images import refresh_variants
+
+
+class TrackedFieldsMixin:
+    """Remembers field values loaded from the database to detect changes on save"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded_value(self, attname, default=None):
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def has_changed(self, *attnames):
+        """True for new instances and when any of the given fields was modified or deferred"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(
+            attname not in loaded or loaded[attname] != getattr(self, attname)
+            for attname in attnames
+        )
+
+    def reset_loaded_values(self):
+        self._loaded_values = {
+            field.attname: self._comparable_value(getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    @staticmethod
+    def _comparable_value(value):
+        # FieldFile objects are mutated in place by FieldFile.save(), keep the name as loaded from the database
+        return value.name if isinstance(value, FieldFile) else value
+
+
+def save_image_variants(instance, save_kwargs):
+    """Refresh image variants unless the save is limited to fields other than image"""
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if refresh_variants(instance) and update_fields is not None:
+        save_kwargs['update_fields'] = set(update_fields) | {'image_variants'}
 
 
 class Category(models.Model):
@@ -18,12 +66,15 @@ class Category(models.Model):
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at'], name='category_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name_ru
 
 
-class Place(models.Model):
+class Place(TrackedFieldsMixin, models.Model):
     """Place/Attraction model"""
     name = models.CharField(max_length=200, verbose_name="Название (EN)")
     name_ru = models.CharField(max_length=200, verbose_name="Название (RU)")
@@ -49,6 +100,8 @@ class Place(models.Model):
         null=True,
         verbose_name="Главное изображение"
     )
+    # Resized copies of image, maintained by places.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
     address = models.CharField(max_length=300, verbose_name="Адрес (EN)")
     address_ru = models.CharField(max_length=300, verbose_name="Адрес (RU)", blank=True)
     opening_hours = models.CharField(max_length=200, blank=True, verbose_name="Часы работы (EN)")
@@ -69,8 +122,29 @@ class Place(models.Model):
         blank=True,
         verbose_name="Долгота"
     )
+    geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Геохеш"
+    )
     amenities = models.JSONField(default=list, blank=True, verbose_name="Удобства")
     is_open = models.BooleanField(default=True, verbose_name="Открыто")
+    # Denormalized from published reviews, maintained by places.aggregates
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    review_avg = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Средняя оценка отзывов"
+    )
+    review_count_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Отзывов на 1")
+    review_count_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Отзывов на 2")
+    review_count_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Отзывов на 3")
+    review_count_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Отзывов на 4")
+    review_count_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Отзывов на 5")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
     published = models.BooleanField(default=True, verbose_name="Опубликовано")
@@ -79,12 +153,42 @@ class Place(models.Model):
         verbose_name = "Место"
         verbose_name_plural = "Места"
         ordering = ['-rating', 'name_ru']
+        # Partial indexes in the default ordering: API queries filter on a bare
+        # "published" column, which only a matching index condition can use.
+        # index_advisor reports queries that still scan or sort.
+        indexes = [
+            models.Index(
+                fields=['-rating', 'name_ru'], condition=Q(published=True), name='place_published_rating_idx',
+            ),
+            models.Index(
+                fields=['category', '-rating', 'name_ru'], condition=Q(published=True),
+                name='place_category_rating_idx',
+            ),
+            # COUNT/MAX(updated_at) of the conditional GET validators
+            models.Index(
+                fields=['category', 'updated_at'], condition=Q(published=True), name='place_published_updated_idx',
+            ),
+            # Changes since a sync token, published or not
+            models.Index(fields=['updated_at'], name='place_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name_ru
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        save_image_variants(self, kwargs)
+        super().save(*args, **kwargs)
+        self.reset_loaded_values()
+
 
-class PlaceImage(models.Model):
+class PlaceImage(TrackedFieldsMixin, models.Model):
     """Additional images for places"""
     place = models.ForeignKey(
         Place,
@@ -93,20 +197,31 @@ class PlaceImage(models.Model):
         verbose_name="Место"
     )
     image = models.ImageField(upload_to='places/gallery/', verbose_name="Изображение")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
     caption = models.CharField(max_length=200, blank=True, verbose_name="Подпись")
     order = models.PositiveIntegerField(default=0, verbose_name="Порядок")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
 
     class Meta:
         verbose_name = "Изображение места"
         verbose_name_plural = "Изображения мест"
         ordering = ['order', 'created_at']
+        indexes = [
+            models.Index(fields=['place', 'order', 'created_at'], name='placeimage_place_order_idx'),
+            models.Index(fields=['updated_at'], name='placeimage_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.place.name_ru} - Image {self.order}"
 
+    def save(self, *args, **kwargs):
+        save_image_variants(self, kwargs)
+        super().save(*args, **kwargs)
+        self.reset_loaded_values()
 
-class Review(models.Model):
+
+class Review(TrackedFieldsMixin, models.Model):
     """Review model for places"""
     place = models.ForeignKey(
         Place,
@@ -129,6 +244,98 @@ class Review(models.Model):
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['-date'], condition=Q(published=True), name='review_published_date_idx'),
+            models.Index(fields=['place', '-date'], condition=Q(published=True), name='review_place_date_idx'),
+            models.Index(fields=['updated_at'], condition=Q(published=True), name='review_published_updated_idx'),
+            models.Index(fields=['updated_at'], name='review_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author} - {self.place.name_ru} ({self.rating}/5)"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.reset_loaded_values()
+
+
+class PlaceAmenity(models.Model):
+    """One entry of Place.amenities, the inverted index behind ?amenities= filters; maintained by places.amenities"""
+    place = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='amenity_entries',
+        verbose_name="Место"
+    )
+    amenity = models.CharField(max_length=100, verbose_name="Удобство")
+
+    class Meta:
+        verbose_name = "Удобство места"
+        verbose_name_plural = "Удобства мест"
+        ordering = ['amenity', 'place']
+        constraints = [
+            # Place ids per amenity straight from the index
+            models.UniqueConstraint(fields=['amenity', 'place'], name='placeamenity_amenity_place_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.place_id}: {self.amenity}"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted row, reported to offline clients by /api/sync/"""
+    # Everything was deleted at once (seed_data): older tokens start over
+    RESET = 'reset'
+    MODEL_CHOICES = [
+        ('category', 'Категория'),
+        ('place', 'Место'),
+        ('placeimage', 'Изображение места'),
+        ('review', 'Отзыв'),
+        (RESET, 'Все данные'),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES, verbose_name="Модель")
+    object_id = models.PositiveBigIntegerField(verbose_name="ID объекта")
+    deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Удалено")
+
+    class Meta:
+        verbose_name = "Удалённый объект"
+        verbose_name_plural = "Удалённые объекты"
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class SimilarPlace(models.Model):
+    """Precomputed nearest neighbours of a place, maintained by places.similar"""
+    # The unique (place, rank) index serves lookups by place
+    place = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='similar_places',
+        db_index=False,
+        verbose_name="Место"
+    )
+    similar = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='similar_for',
+        verbose_name="Похожее место"
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name="Позиция")
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        verbose_name = "Похожее место"
+        verbose_name_plural = "Похожие места"
+        ordering = ['place', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['place', 'rank'], name='similarplace_place_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.place_id} -> {self.similar_id} ({self.rank})"
@@ -0,0 +1,195 @@
+"""
+Pagination classes for places app
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks with a WHERE clause on the ordering columns.
+
+    The cursor holds the ordering values of the last (or first) row shown, so
+    every page is an index range scan with no COUNT(*) and no OFFSET. The
+    ordering is the view's ``cursor_ordering`` or the validated ``?ordering=``
+    with the primary key appended as tie-breaker.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = api_settings.ORDERING_PARAM
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        values, reverse = self.decode_cursor(request)
+
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(queryset.model, values, reverse))
+        order_by = [self.invert(field) for field in self.ordering] if reverse else self.ordering
+        rows = list(queryset.order_by(*order_by)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get(self.ordering_param):
+            # Already validated and applied by the ordering filter
+            ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        else:
+            ordering = list(getattr(view, 'cursor_ordering', None) or queryset.model._meta.ordering)
+        ordering = [field for field in ordering if field.lstrip('-') != 'search_rank']
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def model_field(model, name):
+        """Model field behind an ordering name such as 'rating' or 'category__name', or None"""
+        field = None
+        for part in name.split('__'):
+            if model is None:
+                return None
+            try:
+                field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            model = field.related_model
+        return field
+
+    def seek_filter(self, model, values, reverse):
+        """Rows strictly after (or before, when reverse) the cursor position"""
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            model_field = self.model_field(model, name)
+            try:
+                # A cursor that decodes may still carry values of the wrong type
+                if value is None or isinstance(value, (list, dict)):
+                    raise ValueError(value)
+                if model_field is not None:
+                    value = model_field.to_python(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            descending = field.startswith('-') != reverse
+            condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return list(payload['v']), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                value = value.isoformat()
+            elif isinstance(value, decimal.Decimal):
+                value = str(value)
+            values.append(value)
+        payload = {'v': values}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode())
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class SelectablePagination(BasePagination):
+    """
+    Page-number pagination by default, keyset pagination on request.
+
+    Clients opt in with ``?pagination=cursor`` and then follow the ``next`` /
+    ``previous`` links, which carry a ``cursor`` parameter.
+    """
+    pagination_query_param = 'pagination'
+
+    def __init__(self):
+        self.paginator = PageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get(self.pagination_query_param) == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params):
+            self.paginator = KeysetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.paginator.get_schema_operation_parameters(view)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
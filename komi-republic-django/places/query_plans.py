@@ -0,0 +1,145 @@
+"""
+Query plan checks for places app
+
+Every benchmark scenario is requested through the API while its SQL is
+captured; each distinct statement is then explained and the plan searched
+for full table scans and temporary B-trees built to sort or group rows.
+Those are the statements that slow down as the tables grow.
+"""
+import re
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from .benchmarks import SCENARIOS, BenchmarkRunner
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+# Plan line patterns -> issue kind. SQLite: "SCAN places_place" without an
+# index (virtual FTS tables and constant rows are fine) and "USE TEMP B-TREE";
+# PostgreSQL: "Seq Scan" and "Sort" nodes.
+ISSUE_PATTERNS = {
+    'sqlite': [
+        (re.compile(r'^SCAN (?!CONSTANT ROW)(?!\S+ VIRTUAL TABLE)(?!.* USING (?:COVERING )?INDEX)(\S+)'), 'full scan'),
+        (re.compile(r'^USE TEMP B-TREE FOR (.+)'), 'temp b-tree'),
+    ],
+    'postgresql': [
+        (re.compile(r'Seq Scan on (\S+)'), 'full scan'),
+        (re.compile(r'->\s+Sort\s|^Sort\s'), 'sort'),
+    ],
+}
+
+
+@dataclass
+class StatementPlan:
+    sql: str
+    params: tuple
+    plan: list
+    issues: list = field(default_factory=list)
+
+
+@dataclass
+class ScenarioPlans:
+    scenario: object
+    url: str
+    statements: list = field(default_factory=list)
+
+    @property
+    def issues(self):
+        return [issue for statement in self.statements for issue in statement.issues]
+
+
+class StatementRecorder:
+    """execute_wrapper keeping (alias, sql, params) of every SELECT"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.append((context['connection'].alias, sql, tuple(params or ())))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params, using=connection):
+    prefix = EXPLAIN_PREFIX.get(using.vendor)
+    if prefix is None:
+        raise NotImplementedError(f'EXPLAIN is not supported for {using.vendor}')
+    with using.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    # SQLite rows are (id, parent, notused, detail), PostgreSQL rows are (line,)
+    return [row[-1] for row in rows]
+
+
+def table_rows(table, using=connection):
+    """Row count of table; None for subqueries (``(subquery-4)``, ``qualify``) the plan scans"""
+    if table not in using.introspection.table_names():
+        return None
+    with using.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {using.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+def plan_issues(plan, vendor, min_rows=0, row_counts=None, using=connection):
+    """
+    Issue descriptions for the plan lines matching ISSUE_PATTERNS.
+
+    Full scans of tables with fewer than min_rows rows and of subqueries are
+    ignored; row_counts caches table sizes between calls.
+    """
+    row_counts = {} if row_counts is None else row_counts
+    issues = []
+    for line in plan:
+        line = line.strip()
+        for pattern, kind in ISSUE_PATTERNS.get(vendor, []):
+            match = pattern.search(line)
+            if not match:
+                continue
+            if kind == 'full scan' and min_rows:
+                table = match.group(1)
+                if table not in row_counts:
+                    row_counts[table] = table_rows(table, using)
+                if row_counts[table] is None or row_counts[table] < min_rows:
+                    continue
+            issues.append(f'{kind}: {line}')
+    return issues
+
+
+class QueryPlanAdvisor:
+    def __init__(self, scenarios=SCENARIOS, min_rows=1000):
+        self.scenarios = scenarios
+        self.min_rows = min_rows
+        self.row_counts = {}
+        # One request per scenario is enough to see its statements
+        self.runner = BenchmarkRunner(iterations=1, warmup=0)
+
+    def capture(self, scenario):
+        url, params = self.runner.url(scenario)
+        recorder = StatementRecorder()
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(recorder))
+            self.runner.client.get(url, params)
+        query_string = '&'.join(f'{key}={value}' for key, value in params.items())
+        return (f'{url}?{query_string}' if query_string else url), recorder.statements
+
+    def run(self):
+        reports = []
+        # Cached responses run no SQL
+        with override_settings(API_CACHE_TIMEOUT=0):
+            for scenario in self.scenarios:
+                url, statements = self.capture(scenario)
+                report = ScenarioPlans(scenario, url)
+                for alias, sql, params in dict.fromkeys(statements):
+                    db = connections[alias]
+                    plan = explain(sql, params, db)
+                    report.statements.append(StatementPlan(
+                        sql, params, plan, plan_issues(plan, db.vendor, self.min_rows, self.row_counts, db),
+                    ))
+                reports.append(report)
+        return reports
@@ -0,0 +1,57 @@
+"""
+Renderers for places app
+"""
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson and json.dumps format floats alike except below 1e-4 and from 1e16,
+# where json.dumps switches to exponent notation earlier or spells it differently.
+# Both patterns start with a literal so scanning large payloads stays cheap.
+EXPONENT_RE = re.compile(rb'e[-0-9]')
+SMALL_FLOAT_RE = re.compile(rb'0\.0000')
+DIGITS = b'0123456789'
+
+
+def float_format_differs(ret):
+    """Whether orjson output may contain a float that json.dumps spells differently"""
+    for match in EXPONENT_RE.finditer(ret):
+        if match.start() and ret[match.start() - 1] in DIGITS:
+            return True
+    for match in SMALL_FLOAT_RE.finditer(ret):
+        if not match.start() or ret[match.start() - 1] not in DIGITS:
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes through orjson.
+
+    Anything orjson would render differently from the standard renderer
+    (indented output, ASCII-only output, non-string keys, integers beyond
+    64 bits, floats in exponent range) goes through ``JSONRenderer.render``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if float_format_differs(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
@@ -0,0 +1,105 @@
+"""
+Read replica routing for places app
+
+Reads go to a random alias of ``DATABASE_REPLICAS`` only inside
+``use_replicas()``, which ``ReplicaMiddleware`` enters for GET/HEAD/OPTIONS
+requests. Everything else (writes, admin forms, reviews posted through the
+API, management commands, migrations) reads from and writes to the primary,
+so it never sees rows a replica has not received yet.
+
+After a write a client keeps reading from the primary for
+``REPLICA_LAG_SECONDS`` through a cookie, so a review it just posted shows
+up in its next request even if the replicas lag behind.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replicas_allowed = ContextVar('replicas_allowed', default=False)
+
+
+@contextmanager
+def use_replicas(allowed=True):
+    token = _replicas_allowed.set(allowed)
+    try:
+        yield
+    finally:
+        _replicas_allowed.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send writes to the primary and reads inside use_replicas() to a replica"""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and _replicas_allowed.get():
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def reading_from_replicas():
+    """Whether reads of the current request may go to a replica"""
+    return bool(settings.DATABASE_REPLICAS) and _replicas_allowed.get()
+
+
+def pinned_to_primary(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            return self.pin(self.get_response(request))
+        with use_replicas(not pinned_to_primary(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The context variable is copied into the threads the async ORM runs queries in
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            return self.pin(await self.get_response(request))
+        with use_replicas(not pinned_to_primary(request)):
+            return await self.get_response(request)
+
+    @staticmethod
+    def pin(response):
+        if response.status_code < 400 and settings.REPLICA_LAG_SECONDS:
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time()) + settings.REPLICA_LAG_SECONDS + 1),
+                max_age=settings.REPLICA_LAG_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
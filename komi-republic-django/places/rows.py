@@ -0,0 +1,210 @@
+"""
+Fast list serialization for places app
+
+List endpoints render ``values()`` rows instead of model instances. A
+``RowSerializer`` is derived from the regular serializer of the request, so
+``?fields=`` / ``?lang=`` trimming and field order carry over, and each
+field is rendered with the same conversion DRF would apply. Serializers with
+fields it does not understand fall back to the regular path.
+"""
+from django.core.files.storage import FileSystemStorage
+from django.db.models import ForeignKey
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .images import build_srcset
+
+# DRF field classes whose to_representation is a plain type conversion
+CONVERTERS = {
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.BooleanField: bool,
+}
+# Model fields whose values need no conversion for the converter
+PASSTHROUGH = {
+    str: {'CharField', 'SlugField', 'TextField', 'EmailField', 'URLField'},
+    int: {'AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+          'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField'},
+}
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+class MediaURLs:
+    """
+    Absolute URLs of stored files, as ``request.build_absolute_uri(file.url)`` returns them.
+
+    For the file system storage the absolute media base is built once and
+    names are appended to it; other storages are asked per file.
+    """
+
+    def __init__(self, request, storage):
+        self.request = request
+        self.storage = storage
+        self.base = None
+        # __class__ rather than type() to see through the lazy default storage
+        if storage.__class__.url is FileSystemStorage.url and storage.base_url is not None:
+            self.base = request.build_absolute_uri(storage.base_url)
+
+    def __call__(self, name):
+        if not name:
+            return None
+        # urljoin() in FileSystemStorage.url resolves dot segments
+        if self.base is None or './' in name or name.endswith('.'):
+            return self.request.build_absolute_uri(self.storage.url(name))
+        return self.base + filepath_to_uri(name).lstrip('/')
+
+
+class RowSerializer:
+    """
+    Renders ``values()`` rows exactly like ``serializer`` renders instances.
+
+    Fields with a dotted source through a foreign key are omitted when the
+    key is null, as DRF skips read-only fields whose source raises.
+    Serializers opt method fields in through ``media_url_fields``, mapping the
+    field name to the file field whose absolute URL it returns, and
+    ``srcset_fields``, mapping it to the file field and its variants field.
+    """
+
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        request = serializer.context['request']
+        media_url_fields = getattr(serializer, 'media_url_fields', {})
+        srcset_fields = getattr(serializer, 'srcset_fields', {})
+        self.columns = set()
+        self.fields = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                if name in media_url_fields:
+                    column = media_url_fields[name]
+                    convert = MediaURLs(request, model._meta.get_field(column).storage)
+                elif name in srcset_fields:
+                    file_column, column = srcset_fields[name]
+                    convert = self.srcset(MediaURLs(request, model._meta.get_field(file_column).storage))
+                else:
+                    raise UnsupportedField(name)
+                self.add_field(name, column, convert, required=None)
+                continue
+
+            path = field.source_attrs
+            if not path or len(path) > 2:
+                raise UnsupportedField(name)
+            model_field = model._meta.get_field(path[0])
+            required = None
+            if len(path) == 2:
+                if not isinstance(model_field, ForeignKey):
+                    raise UnsupportedField(name)
+                required = path[0]
+                model_field = model_field.related_model._meta.get_field(path[1])
+            if model_field.is_relation:
+                raise UnsupportedField(name)
+
+            if type(field) is serializers.DecimalField:
+                convert = self.memoized(field.to_representation)
+            elif type(field) in CONVERTERS:
+                convert = CONVERTERS[type(field)]
+                if model_field.get_internal_type() in PASSTHROUGH.get(convert, ()):
+                    # The database already returns this type
+                    convert = None
+            else:
+                raise UnsupportedField(name)
+            self.add_field(name, '__'.join(path), convert, required)
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """Return a row serializer for serializer, or None if it has unsupported fields"""
+        try:
+            return cls(serializer)
+        except UnsupportedField:
+            return None
+
+    def add_field(self, name, column, convert, required):
+        self.fields.append((name, column, convert, required))
+        self.columns.add(column)
+        if required:
+            self.columns.add(required)
+
+    @staticmethod
+    def memoized(convert):
+        """Cache conversions of repeated values such as ratings within one response"""
+        results = {}
+
+        def wrapper(value):
+            try:
+                return results[value]
+            except KeyError:
+                result = results[value] = convert(value)
+                return result
+        return wrapper
+
+    @staticmethod
+    def srcset(urls):
+        def convert(variants):
+            return build_srcset(variants, urls)
+        return convert
+
+    def values(self, queryset, extra_columns=()):
+        """Turn queryset into a values() queryset with the columns rendering needs"""
+        columns = self.columns.union(extra_columns)
+        return queryset.prefetch_related(None).values(*sorted(columns))
+
+    def to_representation(self, rows):
+        fields = self.fields
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert, required in fields:
+                if required is not None and row[required] is None:
+                    continue
+                value = row[column]
+                item[name] = value if value is None or convert is None else convert(value)
+            data.append(item)
+        return data
+
+
+class RowListMixin:
+    """
+    Serve list actions from ``values()`` rows.
+
+    Ordering columns are fetched too, so keyset pagination can build cursors
+    from the rows.
+    """
+
+    def get_row_serializer(self):
+        return RowSerializer.for_serializer(self.get_serializer())
+
+    def get_row_columns(self, queryset):
+        ordering = [
+            *queryset.query.order_by, *queryset.model._meta.ordering,
+            *getattr(self, 'cursor_ordering', ()), 'id',
+        ]
+        columns = set()
+        for field in ordering:
+            if isinstance(field, str) and field.lstrip('-') not in queryset.query.annotations:
+                columns.add(field.lstrip('-'))
+        return columns
+
+    def row_response(self, queryset, paginate=True):
+        """Response with the serialized queryset, paginated if the view paginates"""
+        row_serializer = self.get_row_serializer()
+        if row_serializer is not None:
+            queryset = row_serializer.values(queryset, self.get_row_columns(queryset))
+            serialize = row_serializer.to_representation
+        else:
+            def serialize(objects):
+                return self.get_serializer(objects, many=True).data
+
+        page = self.paginate_queryset(queryset) if paginate else None
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(queryset))
+
+    def list(self, request, *args, **kwargs):
+        return self.row_response(self.filter_queryset(self.get_queryset()))
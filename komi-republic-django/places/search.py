@@ -0,0 +1,149 @@
+"""
+Full-text search over places
+
+SQLite uses an FTS5 table keyed by place id holding pre-stemmed text (Russian
+is stemmed in Python, English by the porter tokenizer). PostgreSQL uses a GIN
+expression index over russian/english tsvectors. Both annotate matching
+places with ``search_rank`` where lower values mean better matches.
+"""
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .stemming import WORD_RE, tokenize
+
+FTS_TABLE = 'places_place_fts'
+FTS_COLUMNS = ('name', 'name_ru', 'description', 'description_ru', 'address', 'address_ru')
+# bm25 column weights in FTS_COLUMNS order: names matter most, addresses least
+FTS_WEIGHTS = (10.0, 10.0, 2.0, 2.0, 1.0, 1.0)
+
+PG_INDEX = 'places_place_search_idx'
+PG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, \"places_place\".\"name\"), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, \"places_place\".\"name_ru\"), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, \"places_place\".\"description\"), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, \"places_place\".\"description_ru\"), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, \"places_place\".\"address\"), 'C') || "
+    "setweight(to_tsvector('russian'::regconfig, \"places_place\".\"address_ru\"), 'C')"
+)
+PG_SEARCH_QUERY = "(to_tsquery('russian'::regconfig, %s) || to_tsquery('english'::regconfig, %s))"
+
+
+def prepare_text(text):
+    return ' '.join(tokenize(text or ''))
+
+
+def fts_match_query(query):
+    """Build an FTS5 MATCH expression requiring every word as a prefix"""
+    return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+
+def search_places(queryset, query):
+    """Filter queryset to places matching query and annotate search_rank"""
+    words = WORD_RE.findall((query or '').lower())
+    if not words:
+        return queryset.none()
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = fts_match_query(query)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        ).annotate(search_rank=RawSQL(
+            # The ranks come from one MATCH over the index. LIMIT -1 keeps SQLite
+            # from flattening the derived table into the correlated lookup, which
+            # would rerun the whole MATCH for every matching place
+            f'SELECT ranks.rank FROM (SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s LIMIT -1) AS ranks WHERE ranks.rowid = "places_place"."id"',
+            (match,),
+            output_field=FloatField(),
+        ))
+
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        params = (tsquery, tsquery)
+        return queryset.filter(
+            RawSQL(f'({PG_SEARCH_VECTOR}) @@ {PG_SEARCH_QUERY}', params, output_field=BooleanField())
+        ).annotate(search_rank=RawSQL(
+            f'-ts_rank({PG_SEARCH_VECTOR}, {PG_SEARCH_QUERY})', params, output_field=FloatField()
+        ))
+
+    # Other backends fall back to substring matching without ranking
+    condition = Q()
+    for field in FTS_COLUMNS:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
+
+
+def index_place(place, using=None):
+    """Insert or refresh a place in the SQLite index; PostgreSQL maintains its own"""
+    connection = connections[using or place._state.db or 'default']
+    if connection.vendor != 'sqlite':
+        return
+    columns = ', '.join(FTS_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(FTS_COLUMNS))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [place.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})',
+            [place.pk] + [prepare_text(getattr(place, field)) for field in FTS_COLUMNS],
+        )
+
+
+def unindex_place(place_id, using=None):
+    connection = connections[using or 'default']
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [place_id])
+
+
+def create_index(connection):
+    """Create the search index structures for the connection's backend"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                f"{', '.join(FTS_COLUMNS)}, tokenize='porter unicode61 remove_diacritics 2')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON places_place USING GIN (({PG_SEARCH_VECTOR}))'
+            )
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+def rebuild_index(place_model, using='default', batch_size=1000):
+    """Repopulate the SQLite index from scratch, returning the number of indexed places"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 0
+    columns = ', '.join(FTS_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(FTS_COLUMNS))
+    rows = place_model._default_manager.using(using).order_by().values_list('id', *FTS_COLUMNS)
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append([row[0]] + [prepare_text(value) for value in row[1:]])
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})', batch
+                )
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})', batch
+            )
+            count += len(batch)
+    return count
@@ -2,10 +2,88 @@
 Serializers for places app
 """
 from rest_framework import serializers
+from .images import build_srcset
 from .models import Category, Place, PlaceImage, Review
 
+LANGUAGES = ('ru', 'en')
 
-class CategorySerializer(serializers.ModelSerializer):
+
+def select_fields(field_names, query_params):
+    """
+    Names of fields to keep for ?fields=a,b and ?lang=ru|en.
+
+    ``lang=ru`` drops English fields that have a ``_ru`` counterpart and
+    ``lang=en`` drops those ``_ru`` counterparts. Unknown names are a
+    validation error, so a typo does not answer with empty objects.
+    """
+    field_names = list(field_names)
+    requested = query_params.get('fields')
+    if requested:
+        wanted = {name.strip() for name in requested.split(',')} - {''}
+        unknown = wanted - set(field_names)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': f'Unknown: {", ".join(sorted(unknown))}. Allowed: {", ".join(field_names)}.'
+            })
+        field_names = [name for name in field_names if name in wanted]
+    lang = query_params.get('lang')
+    if lang and lang not in LANGUAGES:
+        raise serializers.ValidationError({'lang': f'Must be one of: {", ".join(LANGUAGES)}.'})
+    if lang == 'ru':
+        field_names = [name for name in field_names if f'{name}_ru' not in field_names]
+    elif lang == 'en':
+        field_names = [
+            name for name in field_names
+            if not (name.endswith('_ru') and name[:-3] in field_names)
+        ]
+    return field_names
+
+
+def absolute_file_url(storage, name, request=None):
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def image_srcset(obj, request=None):
+    """srcset map of obj.image_variants; reads the storage from the model field so image may stay deferred"""
+    storage = obj._meta.get_field('image').storage
+    return build_srcset(obj.image_variants, lambda name: absolute_file_url(storage, name, request))
+
+
+class DynamicFieldsMixin:
+    """
+    Trims fields according to ?fields= and ?lang= of the request.
+
+    Only the top-level serializer gets the request in its context, so nested
+    serializers keep all their fields.
+    """
+    # Model fields read by SerializerMethodFields, for building .only() lists
+    method_field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        if request is None or not ('fields' in request.query_params or 'lang' in request.query_params):
+            return
+        keep = set(select_fields(self.fields.keys(), request.query_params))
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    def get_only_fields(self):
+        """Model field paths needed to render the remaining fields"""
+        only = []
+        for name, field in self.fields.items():
+            if field.source == '*':
+                only.extend(self.method_field_sources.get(name, []))
+            elif isinstance(field, serializers.ListSerializer):
+                continue  # reverse relations come from prefetches
+            else:
+                only.append(field.source.replace('.', '__'))
+        return only
+
+
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Category model"""
     
     class Meta:
@@ -16,10 +94,11 @@ class CategorySerializer(serializers.ModelSerializer):
 class PlaceImageSerializer(serializers.ModelSerializer):
     """Serializer for PlaceImage model"""
     url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = PlaceImage
-        fields = ['id', 'url', 'caption', 'order']
+        fields = ['id', 'url', 'srcset', 'caption', 'order']
     
     def get_url(self, obj):
         request = self.context.get('request')
@@ -29,19 +108,28 @@ class PlaceImageSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_srcset(self, obj):
+        return image_srcset(obj, self.context.get('request'))
+
 
-class PlaceListSerializer(serializers.ModelSerializer):
+class PlaceListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Place list view"""
     category_slug = serializers.CharField(source='category.slug', read_only=True)
     category_name_ru = serializers.CharField(source='category.name_ru', read_only=True)
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    method_field_sources = {'image_url': ['image'], 'image_srcset': ['image_variants']}
+    # Method fields RowSerializer can render from values() rows:
+    # absolute URL of a file field and srcset map of (file field, variants field)
+    media_url_fields = {'image_url': 'image'}
+    srcset_fields = {'image_srcset': ('image', 'image_variants')}
     
     class Meta:
         model = Place
         fields = [
             'id', 'name', 'name_ru', 'description', 'description_ru',
-            'category_slug', 'category_name_ru', 'rating', 'image_url',
-            'address', 'address_ru', 'latitude', 'longitude'
+            'category_slug', 'category_name_ru', 'rating', 'review_count', 'review_avg',
+            'image_url', 'image_srcset', 'address', 'address_ru', 'latitude', 'longitude'
         ]
     
     def get_image_url(self, obj):
@@ -52,18 +140,37 @@ class PlaceListSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get('request'))
+
+
+class PlaceNearbySerializer(PlaceListSerializer):
+    """Serializer for Place list view with distance from the search point"""
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(PlaceListSerializer.Meta):
+        fields = PlaceListSerializer.Meta.fields + ['distance_km']
+
 
-class PlaceDetailSerializer(serializers.ModelSerializer):
+class PlaceDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Place detail view"""
     category = CategorySerializer(read_only=True)
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     images = PlaceImageSerializer(many=True, read_only=True)
+    review_distribution = serializers.SerializerMethodField()
+    method_field_sources = {
+        'image_url': ['image'],
+        'image_srcset': ['image_variants'],
+        'review_distribution': [f'review_count_{star}' for star in range(1, 6)],
+    }
     
     class Meta:
         model = Place
         fields = [
             'id', 'name', 'name_ru', 'description', 'description_ru',
-            'category', 'rating', 'image_url', 'images',
+            'category', 'rating', 'review_count', 'review_avg', 'review_distribution',
+            'image_url', 'image_srcset', 'images',
             'address', 'address_ru', 'opening_hours', 'opening_hours_ru',
             'entry_fee', 'entry_fee_ru', 'latitude', 'longitude',
             'amenities', 'is_open', 'created_at', 'updated_at'
@@ -77,6 +184,13 @@ class PlaceDetailSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj, self.context.get('request'))
+
+    def get_review_distribution(self, obj):
+        """Number of published reviews per star, keyed '1'..'5'"""
+        return {str(star): getattr(obj, f'review_count_{star}') for star in range(1, 6)}
+
 
 class ReviewSerializer(serializers.ModelSerializer):
     """Serializer for Review model"""
@@ -91,3 +205,50 @@ class ReviewSerializer(serializers.ModelSerializer):
         if value < 1 or value > 5:
             raise serializers.ValidationError("Rating must be between 1 and 5")
         return value
+
+
+class PlaceBatchSerializer(PlaceDetailSerializer):
+    """
+    Serializer for Place batch view.
+
+    ``images``, ``category`` and ``reviews`` (the latest published reviews,
+    prefetched into ``recent_reviews``) are only kept when listed in the
+    ``include`` context entry.
+    """
+    embedded_fields = ('images', 'category', 'reviews')
+    reviews = ReviewSerializer(many=True, read_only=True, source='recent_reviews')
+
+    class Meta(PlaceDetailSerializer.Meta):
+        fields = PlaceDetailSerializer.Meta.fields + ['reviews']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        include = self.context.get('include', ())
+        for name in self.embedded_fields:
+            if name not in include:
+                self.fields.pop(name, None)
+
+
+class PlaceSyncSerializer(PlaceDetailSerializer):
+    """Serializer for Place rows of /api/sync/: the category as an id, images synced on their own"""
+    category = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta(PlaceDetailSerializer.Meta):
+        fields = [name for name in PlaceDetailSerializer.Meta.fields if name != 'images']
+
+
+class PlaceImageSyncSerializer(PlaceImageSerializer):
+    """Serializer for PlaceImage rows of /api/sync/"""
+
+    class Meta(PlaceImageSerializer.Meta):
+        fields = PlaceImageSerializer.Meta.fields + ['place']
+
+
+class PlaceRatingSerializer(serializers.ModelSerializer):
+    """Serializer for rating events of /api/live/"""
+    place = serializers.IntegerField(source='pk', read_only=True)
+    category = serializers.CharField(source='category.slug', read_only=True, default=None)
+
+    class Meta:
+        model = Place
+        fields = ['place', 'category', 'rating', 'review_count', 'review_avg']
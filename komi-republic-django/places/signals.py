@@ -0,0 +1,129 @@
+"""
+Signal handlers for places app
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .aggregates import review_deleted, review_saved
+from .amenities import index_amenities
+from .autocomplete import AUTOCOMPLETE_GENERATION, INDEXED_FIELDS as AUTOCOMPLETE_FIELDS
+from .cache import bump_generation, model_generation
+from .clusters import GEO_GENERATION, schedule_rebuild
+from .live import publish_changes
+from .models import Category, Place, PlaceImage, Review, SimilarPlace, Tombstone
+from .search import FTS_COLUMNS, index_place, unindex_place
+from .similar import SIMILARITY_FIELDS, schedule_refresh
+
+GEO_FIELDS = ('latitude', 'longitude', 'published', 'category_id')
+
+
+def bump_on_commit(name, using=None):
+    # A bump before commit would let a concurrent request cache uncommitted-era data under the new generation
+    transaction.on_commit(partial(bump_generation, name), using=using or 'default')
+
+
+def bump_geo_on_commit(using=None):
+    bump_on_commit(GEO_GENERATION, using)
+    # Registered after the bump, so the clusters are rebuilt for the new generation
+    transaction.on_commit(schedule_rebuild, using=using or 'default')
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    using = using or 'default'
+    if created or instance.has_changed(*GEO_FIELDS):
+        bump_geo_on_commit(using)
+    if created or instance.has_changed(*FTS_COLUMNS):
+        index_place(instance, using=using)
+    if created or instance.has_changed(*AUTOCOMPLETE_FIELDS):
+        bump_on_commit(AUTOCOMPLETE_GENERATION, using)
+    if created or instance.has_changed('amenities'):
+        index_amenities(instance, using=using)
+    if created or instance.has_changed(*SIMILARITY_FIELDS):
+        transaction.on_commit(partial(schedule_refresh, instance.pk, using), using=using, robust=True)
+
+
+@receiver(pre_delete, sender=Place)
+def place_deleting(sender, instance, using=None, **kwargs):
+    # The cascade removes the rows naming this place before post_delete runs
+    instance.similar_referrers = list(
+        SimilarPlace.objects.using(using or 'default').filter(similar=instance).values_list('place_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Place)
+def place_deleted(sender, instance, using=None, **kwargs):
+    using = using or 'default'
+    bump_geo_on_commit(using)
+    bump_on_commit(AUTOCOMPLETE_GENERATION, using)
+    unindex_place(instance.pk, using=using)
+    referrers = getattr(instance, 'similar_referrers', ())
+    transaction.on_commit(partial(schedule_refresh, instance.pk, using, referrers), using=using, robust=True)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    # Clusters filtered by category are keyed on its slug
+    bump_geo_on_commit(using)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, using=None, **kwargs):
+    # SET_NULL clears Place.category with a bare UPDATE; move updated_at so syncs and validators see it
+    Place.objects.using(using or 'default').filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Review)
+def review_saved_handler(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    using = using or 'default'
+    review_saved(instance, created, using=using)
+    place_ids = {instance.place_id, instance.loaded_value('place_id', instance.place_id)}
+    transaction.on_commit(partial(publish_changes, [instance.pk], place_ids, using), using=using)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted_handler(sender, instance, using=None, **kwargs):
+    using = using or 'default'
+    review_deleted(instance, using=using)
+    transaction.on_commit(partial(publish_changes, place_ids=[instance.place_id], using=using), using=using)
+
+
+@receiver(post_save, sender=PlaceImage)
+@receiver(post_delete, sender=PlaceImage)
+def place_image_changed(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    # Gallery changes alter the place's detail payload, so its validators must move
+    Place.objects.using(using or 'default').filter(pk=instance.place_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Place)
+@receiver(post_delete, sender=PlaceImage)
+@receiver(post_delete, sender=Review)
+def record_tombstone(sender, instance, using=None, **kwargs):
+    # Offline clients learn about hard deletes from /api/sync/
+    Tombstone.objects.using(using or 'default').create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Place)
+@receiver(post_save, sender=PlaceImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Place)
+@receiver(post_delete, sender=PlaceImage)
+@receiver(post_delete, sender=Review)
+def invalidate_responses(sender, instance, using=None, **kwargs):
+    bump_on_commit(model_generation(sender), using)
@@ -0,0 +1,288 @@
+"""
+Similar places for places app
+
+Every published place keeps its ``NEIGHBOURS`` most similar published places
+in ``SimilarPlace``, so ``/api/places/{id}/similar/`` is one indexed join.
+The score of a pair is a weighted sum of
+
+* the same category,
+* the Jaccard overlap of their ``amenities`` lists,
+* how close their ratings are,
+* ``exp(-distance / DISTANCE_SCALE_KM)`` between their coordinates,
+
+computed with NumPy for ``BLOCK_ROWS`` places against all others at a time.
+``rebuild`` replaces the whole table (``compute_similar_places``, the data
+generator); ``refresh_places`` updates it after places change. The score
+is symmetric, so a changed place enters another place's list exactly when it
+beats that list's last entry, and only those lists and the ones it was in
+are recomputed.
+
+A refresh loads the features of every place, so saves only queue their place
+(``schedule_refresh``). A background thread of the worker refreshes what was
+queued within ``SIMILAR_REFRESH_INTERVAL`` seconds in one pass.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from .cache import bump_generation, model_generation
+from .geo import EARTH_RADIUS_KM
+from .models import Place, SimilarPlace
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS = 10
+BLOCK_ROWS = 1024
+DISTANCE_SCALE_KM = 50
+WEIGHT_CATEGORY = 0.35
+WEIGHT_AMENITIES = 0.3
+WEIGHT_RATING = 0.1
+WEIGHT_DISTANCE = 0.25
+
+# Changes to these fields move a place's scores
+SIMILARITY_FIELDS = ('category_id', 'amenities', 'rating', 'latitude', 'longitude', 'published')
+
+
+class Features:
+    """Feature arrays of all published places, one row per place"""
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.index = {pk: i for i, pk in enumerate(self.ids.tolist())}
+        # Places without a category get a code of their own that matches no other place
+        self.category = np.array(
+            [-i - 1 if row[1] is None else row[1] for i, row in enumerate(rows)], dtype=np.int64,
+        )
+
+        amenities = [
+            {str(item) for item in row[2]} if isinstance(row[2], list) else set()
+            for row in rows
+        ]
+        vocabulary = {name: i for i, name in enumerate(sorted(set().union(*amenities)))}
+        self.amenities = np.zeros((len(rows), len(vocabulary)), dtype=np.float32)
+        for i, names in enumerate(amenities):
+            self.amenities[i, [vocabulary[name] for name in names]] = 1
+        self.amenity_count = self.amenities.sum(axis=1)
+
+        self.rating = np.array([float(row[3] or 0) / 5 for row in rows], dtype=np.float32)
+        # Points on the unit sphere, their straight-line distance stands in for the great-circle one
+        self.located = np.array([row[4] is not None and row[5] is not None for row in rows])
+        latitude = np.radians([float(row[4] or 0) for row in rows])
+        longitude = np.radians([float(row[5] or 0) for row in rows])
+        self.position = np.stack([
+            np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude), np.sin(latitude),
+        ], axis=1).astype(np.float32).reshape(len(rows), 3)
+
+    @classmethod
+    def load(cls, using='default', place_model=Place):
+        return cls(
+            place_model._default_manager.using(using).filter(published=True).order_by('pk')
+            .values_list('pk', 'category_id', 'amenities', 'rating', 'latitude', 'longitude')
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """(len(rows), len(self)) scores of the places at indexes rows against all; -inf for self-pairs"""
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # Terms are accumulated in place to keep block-sized temporaries few.
+        # The chord is within 0.1% of the great-circle distance up to 500 km,
+        # beyond which closeness is negligible anyway; it is summed from
+        # coordinate differences, as 1 - cos() loses metres in float32.
+        scores = np.zeros((len(rows), len(self)), dtype=np.float32)
+        buffer = np.empty_like(scores)
+        for axis in range(3):
+            np.subtract(self.position[rows, axis, None], self.position[None, :, axis], out=buffer)
+            buffer *= buffer
+            scores += buffer
+        np.sqrt(scores, out=scores)
+        scores *= -EARTH_RADIUS_KM / DISTANCE_SCALE_KM
+        np.exp(scores, out=scores)
+        scores *= WEIGHT_DISTANCE
+        # No closeness when either place has no coordinates
+        scores[~self.located[rows]] = 0
+        scores[:, ~self.located] = 0
+
+        shared = self.amenities[rows] @ self.amenities.T
+        union = np.add(self.amenity_count[rows, None], self.amenity_count[None, :], out=buffer)
+        union -= shared
+        # Places without amenities share none: 0 / 1 instead of 0 / 0
+        np.maximum(union, 1, out=union)
+        shared /= union
+        shared *= WEIGHT_AMENITIES
+        scores += shared
+
+        rating = np.subtract(self.rating[rows, None], self.rating[None, :], out=buffer)
+        np.abs(rating, out=rating)
+        rating *= -WEIGHT_RATING
+        rating += WEIGHT_RATING
+        scores += rating
+
+        same_category = np.equal(self.category[rows, None], self.category[None, :], out=rating)
+        same_category *= WEIGHT_CATEGORY
+        scores += same_category
+
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return scores
+
+    def neighbours(self, rows, k=NEIGHBOURS):
+        """(place_id, similar_id, rank, score) of the k best neighbours of the places at indexes rows"""
+        k = min(k, len(self) - 1)
+        if k <= 0 or not len(rows):
+            return []
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = self.scores(rows)
+        # Everything scoring at least the k-th best, so ties at the cut are
+        # broken by id rather than by where argpartition happens to leave them
+        kth = np.partition(scores, -k, axis=1)[:, -k]
+        block_rows, columns = np.nonzero(scores >= kth[:, None])
+        values = scores[block_rows, columns]
+        # Per place: best score first, lower id first among equal scores
+        order = np.lexsort((self.ids[columns], -values, block_rows))
+        block_rows, columns, values = block_rows[order], columns[order], values[order]
+        rank = np.arange(len(block_rows)) - np.searchsorted(block_rows, block_rows) + 1
+        keep = rank <= k
+        return list(zip(
+            self.ids[rows[block_rows[keep]]].tolist(),
+            self.ids[columns[keep]].tolist(),
+            rank[keep].tolist(),
+            values[keep].astype(np.float64).round(6).tolist(),
+        ))
+
+
+def insert_links(links, using='default', similar_model=SimilarPlace):
+    # executemany skips building a model instance per row, which bulk_create spends most of a rebuild on
+    if not links:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = [similar_model._meta.get_field(name).column for name in ('place', 'similar', 'rank', 'score')]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(similar_model._meta.db_table), ', '.join(quote(column) for column in columns), ', '.join(['%s'] * 4),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, links)
+
+
+def invalidate(using='default'):
+    """Bump the cached similar responses once the current transaction commits"""
+    transaction.on_commit(partial(bump_generation, model_generation(SimilarPlace)), using=using)
+
+
+def rebuild(using='default', block_rows=BLOCK_ROWS, place_model=Place, similar_model=SimilarPlace):
+    """
+    Recompute the neighbours of every published place; returns the number of
+    places. Migrations pass their historical place_model and similar_model.
+    """
+    features = Features.load(using, place_model)
+    similar_model._default_manager.using(using).all().delete()
+    for start in range(0, len(features), block_rows):
+        rows = np.arange(start, min(start + block_rows, len(features)))
+        insert_links(features.neighbours(rows), using, similar_model)
+    invalidate(using)
+    return len(features)
+
+
+def refresh_places(place_ids, using='default', referrers=(), block_rows=BLOCK_ROWS):
+    """
+    Update the table after place_ids were saved or deleted. referrers are
+    places whose lists held them, for deletes where the rows are gone already.
+    """
+    features = Features.load(using)
+    place_ids = set(place_ids)
+    affected = {*place_ids, *referrers}
+    affected.update(
+        SimilarPlace.objects.using(using).filter(similar_id__in=place_ids).values_list('place_id', flat=True)
+    )
+    changed = [features.index[pk] for pk in place_ids if pk in features.index]
+    if changed and len(features) > 1:
+        # Lists that are full need to be beaten, shorter ones take any place
+        threshold = np.full(len(features), -np.inf, dtype=np.float32)
+        full = SimilarPlace.objects.using(using).filter(rank=min(NEIGHBOURS, len(features) - 1))
+        for other_id, score in full.values_list('place_id', 'score'):
+            if other_id in features.index:
+                threshold[features.index[other_id]] = score
+        for start in range(0, len(changed), block_rows):
+            beaten = features.scores(changed[start:start + block_rows]) > threshold
+            affected.update(features.ids[beaten.any(axis=0)].tolist())
+
+    rows = sorted(features.index[pk] for pk in affected if pk in features.index)
+    with transaction.atomic(using=using):
+        SimilarPlace.objects.using(using).filter(place_id__in=affected).delete()
+        insert_links(features.neighbours(rows), using)
+        invalidate(using)
+    return len(rows)
+
+
+class RefreshQueue:
+    """Places waiting for refresh_places, refreshed by a background thread of the worker"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.pid = os.getpid()
+        # Database alias -> (place ids, referrers)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='similar-refresh', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def add(self, place_id, using='default', referrers=()):
+        with self.lock:
+            place_ids, referrer_ids = self.pending.setdefault(using, (set(), set()))
+            place_ids.add(place_id)
+            referrer_ids.update(referrers)
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            # Saves arriving meanwhile share the pass, e.g. an admin bulk action
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Refresh everything queued so far"""
+        with self.refresh_lock:
+            with self.lock:
+                self.wakeup.clear()
+                pending, self.pending = self.pending, {}
+            for using, (place_ids, referrers) in pending.items():
+                close_old_connections()
+                try:
+                    refresh_places(place_ids, using, referrers)
+                except Exception:
+                    logger.exception('Could not refresh similar places of %s place(s)', len(place_ids))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_refresh_queue():
+    global _queue
+    if _queue is None or _queue.pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue.pid != os.getpid():
+                _queue = RefreshQueue(settings.SIMILAR_REFRESH_INTERVAL)
+    return _queue
+
+
+def schedule_refresh(place_id, using='default', referrers=()):
+    """Queue a refresh after place_id was saved or deleted; refresh right away with SIMILAR_REFRESH_INTERVAL=0"""
+    if settings.SIMILAR_REFRESH_INTERVAL <= 0:
+        refresh_places([place_id], using, referrers)
+    else:
+        get_refresh_queue().add(place_id, using, referrers)
@@ -0,0 +1,189 @@
+"""
+Static snapshot of the public API for places app
+
+Every public GET resource is rendered through the API itself and written as
+JSON next to ``.gz`` (and ``.br`` when the brotli module is installed)
+variants that nginx serves with ``gzip_static`` / ``brotli_static``.
+
+A manifest keeps the ETag of every exported URL. The next export sends it
+as ``If-None-Match``, so unchanged resources cost one aggregate query and
+are not rendered, compressed or rewritten. List pages share the ETag of
+their first page, which covers the whole filtered list.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from django.test import Client
+
+from .models import Category, Place
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+
+def snapshot_path(url):
+    """
+    Relative file path for an API URL.
+
+    ``/api/places/`` maps to ``api/places/index.json``, ``?page=3`` to
+    ``page-3.json`` and other parameters to ``name-value`` directories, so
+    ``/api/reviews/?place=5&page=2`` becomes ``api/reviews/place-5/page-2.json``.
+    """
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query))
+    page = params.pop('page', None)
+    segments = [segment for segment in parts.path.split('/') if segment]
+    segments += [f'{name}-{value}' for name, value in sorted(params.items())]
+    segments.append(f'page-{page}.json' if page else 'index.json')
+    return '/'.join(segments)
+
+
+class SnapshotExporter:
+    """Export the public API into directory, reusing unchanged files from the last run"""
+
+    def __init__(self, directory, base_url='http://localhost', full=False):
+        self.directory = Path(directory)
+        parts = urlsplit(base_url)
+        self.base_url = f'{parts.scheme}://{parts.netloc}'
+        self.client = Client(HTTP_HOST=parts.netloc, secure=parts.scheme == 'https')
+        self.manifest = {} if full else self.load_manifest()
+        self.files = {}
+        self.stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+
+    def load_manifest(self):
+        try:
+            manifest = json.loads((self.directory / MANIFEST_NAME).read_text())
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('base_url') != self.base_url:
+            return {}
+        return manifest.get('files', {})
+
+    def targets(self):
+        """(url, is_list) for every exported resource"""
+        yield '/api/categories/', True
+        for slug in Category.objects.filter(published=True).order_by('pk').values_list('slug', flat=True):
+            yield f'/api/categories/{slug}/', False
+        yield '/api/places/', True
+        yield '/api/places/featured/', False
+        for place_id in Place.objects.filter(published=True).order_by('pk').values_list('pk', flat=True):
+            yield f'/api/places/{place_id}/', False
+            yield f'/api/reviews/?{urlencode({"place": place_id})}', True
+
+    def export(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for url, is_list in self.targets():
+            if is_list:
+                self.export_list(url)
+            else:
+                self.export_resource(url)
+        self.remove_stale()
+        self.write_atomic(
+            self.directory / MANIFEST_NAME,
+            json.dumps({
+                'version': MANIFEST_VERSION, 'base_url': self.base_url, 'files': self.files,
+            }, indent=2, sort_keys=True).encode(),
+        )
+        return self.stats
+
+    def unchanged_entry(self, path):
+        """Manifest entry for path if the last export wrote it and it is still on disk"""
+        entry = self.manifest.get(path)
+        if entry and (self.directory / path).exists():
+            return entry
+        return None
+
+    def export_resource(self, url):
+        path = snapshot_path(url)
+        entry = self.unchanged_entry(path)
+        headers = {'HTTP_IF_NONE_MATCH': entry['etag']} if entry else {}
+        response = self.client.get(url, **headers)
+        if response.status_code == 304:
+            self.files[path] = entry
+            self.stats['unchanged'] += 1
+        elif response.status_code == 200:
+            self.save(path, url, response)
+
+    def export_list(self, url):
+        """Export every page of a paginated list, following next links"""
+        first = snapshot_path(url)
+        entry = self.unchanged_entry(first)
+        pages = entry.get('pages', []) if entry else []
+        if entry and all(self.unchanged_entry(page) for page in pages):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=entry['etag'])
+            if response.status_code == 304:
+                for path in [first, *pages]:
+                    self.files[path] = self.manifest[path]
+                self.stats['unchanged'] += 1 + len(pages)
+                return
+        else:
+            response = self.client.get(url)
+
+        pages = []
+        while response.status_code == 200:
+            path = snapshot_path(url)
+            self.save(path, url, response)
+            if path != first:
+                pages.append(path)
+            next_url = response.json().get('next')
+            if not next_url:
+                break
+            parts = urlsplit(next_url)
+            url = f'{parts.path}?{parts.query}'
+            response = self.client.get(url)
+        if first in self.files:
+            self.files[first]['pages'] = pages
+
+    def save(self, path, url, response):
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        previous = self.manifest.get(path)
+        self.files[path] = {'url': url, 'etag': response.get('ETag', ''), 'sha256': digest}
+        target = self.directory / path
+        if previous and previous.get('sha256') == digest and target.exists():
+            # Same bytes under a new ETag, e.g. after a no-op save
+            self.stats['unchanged'] += 1
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        self.write_atomic(target, content)
+        self.write_atomic(target.with_name(target.name + '.gz'), gzip.compress(content, compresslevel=9, mtime=0))
+        brotli_path = target.with_name(target.name + '.br')
+        if brotli is not None:
+            self.write_atomic(brotli_path, brotli.compress(content, quality=11))
+        elif brotli_path.exists():
+            brotli_path.unlink()
+        self.stats['written'] += 1
+
+    def remove_stale(self):
+        """Delete files of resources that disappeared, e.g. unpublished places or shorter lists"""
+        for path in self.manifest.keys() - self.files.keys():
+            target = self.directory / path
+            for candidate in [target, *(target.with_name(target.name + suffix) for suffix in COMPRESSED_SUFFIXES)]:
+                if candidate.exists():
+                    candidate.unlink()
+            self.stats['removed'] += 1
+
+    @staticmethod
+    def write_atomic(target, content):
+        """Replace target in one step so nginx never serves a half-written file"""
+        fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix='.snapshot-')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(content)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
@@ -0,0 +1,130 @@
+"""
+Russian Snowball stemmer used to prepare text for the SQLite search index
+
+SQLite ships only an English (porter) stemmer, so Cyrillic words are stemmed
+here before they reach FTS5. PostgreSQL uses its own 'russian' configuration.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+PERFECTIVE_GERUND = {
+    'в': 1, 'вши': 1, 'вшись': 1,
+    'ив': 2, 'ивши': 2, 'ившись': 2, 'ыв': 2, 'ывши': 2, 'ывшись': 2,
+}
+ADJECTIVE = dict.fromkeys((
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым',
+    'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+), 2)
+PARTICIPLE = {
+    'ем': 1, 'нн': 1, 'вш': 1, 'ющ': 1, 'щ': 1,
+    'ивш': 2, 'ывш': 2, 'ующ': 2,
+}
+REFLEXIVE = dict.fromkeys(('ся', 'сь'), 2)
+VERB = {
+    **dict.fromkeys((
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют',
+        'ны', 'ть', 'ешь', 'нно',
+    ), 1),
+    **dict.fromkeys((
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил',
+        'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт',
+        'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ), 2),
+}
+NOUN = dict.fromkeys((
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией',
+    'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах',
+    'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+), 2)
+DERIVATIONAL = dict.fromkeys(('ост', 'ость'), 2)
+SUPERLATIVE = dict.fromkeys(('ейш', 'ейше'), 2)
+
+
+def _regions(word):
+    """Return start offsets of the RV and R2 regions"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+
+    def after_vowel_consonant(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = after_vowel_consonant(0)
+    r2 = after_vowel_consonant(r1)
+    return rv, r2
+
+
+def _remove(word, region_start, endings):
+    """
+    Remove the longest ending of the group found inside the region.
+
+    Group 1 endings only match when preceded by 'а' or 'я', which stay in the
+    word. Returns None when nothing was removed.
+    """
+    region = word[region_start:]
+    for length in range(min(len(region), 6), 0, -1):
+        ending = region[-length:]
+        group = endings.get(ending)
+        if group is None:
+            continue
+        if group == 1 and (len(region) == length or region[-length - 1] not in 'ая'):
+            return None
+        return word[:-length]
+    return None
+
+
+def stem_russian(word):
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+
+    # Step 1
+    stemmed = _remove(word, rv, PERFECTIVE_GERUND)
+    if stemmed is None:
+        word = _remove(word, rv, REFLEXIVE) or word
+        stemmed = _remove(word, rv, ADJECTIVE)
+        if stemmed is not None:
+            stemmed = _remove(stemmed, rv, PARTICIPLE) or stemmed
+        else:
+            stemmed = _remove(word, rv, VERB)
+            if stemmed is None:
+                stemmed = _remove(word, rv, NOUN)
+    word = stemmed if stemmed is not None else word
+
+    # Step 2
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+
+    # Step 3
+    if len(word) > r2:
+        word = _remove(word, r2, DERIVATIONAL) or word
+
+    # Step 4
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        superlative = _remove(word, rv, SUPERLATIVE)
+        if superlative is not None:
+            word = superlative
+            if word.endswith('нн'):
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) > rv:
+            word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercase words of text with Cyrillic ones reduced to their stems"""
+    tokens = []
+    for token in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        if CYRILLIC_RE.search(token):
+            token = stem_russian(token)
+        tokens.append(token)
+    return tokens
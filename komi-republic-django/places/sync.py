@@ -0,0 +1,139 @@
+"""
+Delta sync for offline clients in places app
+
+``/api/sync/?since=<token>`` pages through the rows of every synced model in
+``(updated_at, id)`` order. Published rows are returned in full, unpublished
+rows and ``Tombstone`` records of hard deletes as ids to remove. The token
+holds the position reached in each model, so a client calls again with the
+returned token while ``has_more`` is true and on its next launch.
+
+Rows are only read up to ``SYNC_SETTLE_SECONDS`` ago: a transaction that
+stamped ``updated_at`` earlier but commits later is still picked up by the
+next sync instead of falling behind a position already handed out.
+"""
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Category, Place, PlaceImage, Review, Tombstone
+
+# Response key -> model, in the order clients should apply them
+SYNCED_MODELS = {
+    'categories': Category,
+    'places': Place,
+    'images': PlaceImage,
+    'reviews': Review,
+}
+DELETED = 'deleted'
+
+
+def encode_token(positions):
+    """Opaque token for {key: (updated_at, pk or None)}"""
+    payload = {
+        key: [moment.isoformat(), pk] for key, (moment, pk) in positions.items()
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode('ascii')
+
+
+def decode_token(token):
+    """Positions of a token; ValueError when it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        positions = {}
+        for key in (*SYNCED_MODELS, DELETED):
+            moment, pk = payload[key]
+            moment = datetime.datetime.fromisoformat(moment)
+            if timezone.is_naive(moment) or (pk is not None and not isinstance(pk, int)):
+                raise ValueError('Invalid position')
+            positions[key] = (moment, pk)
+        return positions
+    except (TypeError, KeyError, UnicodeError, binascii.Error) as exc:
+        raise ValueError(str(exc))
+
+
+def current_token(now=None):
+    """Token of a client that is up to date at now"""
+    horizon = (now or timezone.now()) - datetime.timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    return encode_token({key: (horizon, None) for key in (*SYNCED_MODELS, DELETED)})
+
+
+def after(queryset, position, field_name):
+    """Rows strictly after position in (field_name, pk) order"""
+    if position is None:
+        return queryset
+    moment, pk = position
+    if pk is None:
+        return queryset.filter(**{f'{field_name}__gt': moment})
+    # The bare range condition lets the database walk the index on field_name
+    return queryset.filter(**{f'{field_name}__gte': moment}).exclude(**{field_name: moment, 'pk__lte': pk})
+
+
+@dataclass
+class SyncPage:
+    changed: dict = field(default_factory=dict)
+    deleted: dict = field(default_factory=dict)
+    positions: dict = field(default_factory=dict)
+    has_more: bool = False
+    reset: bool = False
+
+
+class DeltaSync:
+    def __init__(self, token=None, page_size=None, now=None):
+        self.page_size = page_size or settings.SYNC_PAGE_SIZE
+        now = now or timezone.now()
+        self.horizon = now - datetime.timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+        self.positions = decode_token(token) if token else None
+        self.reset = False
+        oldest_tombstone = now - datetime.timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        if self.positions and self.positions[DELETED][0] < oldest_tombstone:
+            # Deletes since then may have been pruned: start over from a full download
+            self.positions = None
+            self.reset = True
+
+    def run(self):
+        page = SyncPage(reset=self.reset)
+        initial = self.positions is None
+        for key, model in SYNCED_MODELS.items():
+            position = None if initial else self.positions[key]
+            queryset = after(model._default_manager.filter(updated_at__lte=self.horizon), position, 'updated_at')
+            if initial and hasattr(model, 'published'):
+                # A fresh download has nothing to remove
+                queryset = queryset.filter(published=True)
+            rows = list(queryset.order_by('updated_at', 'pk')[:self.page_size])
+            page.changed[key] = [row for row in rows if getattr(row, 'published', True)]
+            page.deleted[key] = [row.pk for row in rows if not getattr(row, 'published', True)]
+            page.positions[key] = self.next_position(rows, 'updated_at', position)
+            page.has_more |= len(rows) == self.page_size
+
+        if initial:
+            page.positions[DELETED] = (self.horizon, None)
+        else:
+            position = self.positions[DELETED]
+            tombstones = list(
+                after(Tombstone.objects.filter(deleted_at__lte=self.horizon), position, 'deleted_at')
+                .order_by('deleted_at', 'pk')[:self.page_size]
+            )
+            if any(tombstone.model == Tombstone.RESET for tombstone in tombstones):
+                # The catalogue was cleared without a tombstone per row
+                self.positions = None
+                self.reset = True
+                return self.run()
+            models = {model._meta.model_name: key for key, model in SYNCED_MODELS.items()}
+            for tombstone in tombstones:
+                page.deleted[models[tombstone.model]].append(tombstone.object_id)
+            page.positions[DELETED] = self.next_position(tombstones, 'deleted_at', position)
+            page.has_more |= len(tombstones) == self.page_size
+        return page
+
+    def next_position(self, rows, field_name, position):
+        if len(rows) == self.page_size:
+            return getattr(rows[-1], field_name), rows[-1].pk
+        # Everything up to the horizon has been read
+        if position is not None and position[0] > self.horizon:
+            return position
+        return self.horizon, None
@@ -0,0 +1,187 @@
+"""
+Request timing for places app
+
+``ServerTimingMiddleware`` records every SQL statement a request runs and
+splits its wall time into database, view and render phases:
+
+- ``db``: time spent executing SQL and fetching its rows (SQLite reads
+  most of them lazily in ``fetchmany`` after ``execute``), with the query
+  count in the description;
+- ``serialize``: view time outside SQL, i.e. building querysets and
+  serializing rows, or reading the response cache;
+- ``render``: turning ``Response.data`` into JSON;
+- ``total``: the whole request as seen by the middleware.
+
+They are sent as a ``Server-Timing`` header, which browser dev tools show
+next to the request. Requests over ``SLOW_REQUEST_MS`` or
+``SLOW_REQUEST_QUERIES`` are logged to ``places.timing`` with their slowest
+statements and the statements repeated most often.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+
+logger = logging.getLogger(__name__)
+
+# Statements listed in a slow-request log entry
+SLOW_LOG_QUERIES = 10
+# Cursor methods timed as part of the statement executed before them
+FETCH_METHODS = ('fetchone', 'fetchmany', 'fetchall')
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = []
+        self.db_ms = 0.0
+        self.view_start = None
+        self.view_db_ms = 0.0
+        self.view_ms = None
+        self.view_end = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.db_ms += duration
+            self.queries.append((duration, context['connection'].alias, sql, params))
+            self.time_fetches(context['cursor'], len(self.queries) - 1)
+
+    def time_fetches(self, cursor, index):
+        """Count the fetch calls on cursor towards db and the statement at index"""
+        def timed(fetch):
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fetch(*args, **kwargs)
+                finally:
+                    duration = (time.perf_counter() - start) * 1000
+                    self.db_ms += duration
+                    query = self.queries[index]
+                    self.queries[index] = (query[0] + duration, *query[1:])
+            return wrapper
+
+        # Instance attributes shadow CursorWrapper.__getattr__, which still
+        # hands out the driver's methods wrapped in its error translation
+        for name in FETCH_METHODS:
+            setattr(cursor, name, timed(CursorWrapper.__getattr__(cursor, name)))
+
+    def view_started(self):
+        self.view_start = time.perf_counter()
+        self.view_db_ms = self.db_ms
+
+    def view_finished(self):
+        if self.view_start is None or self.view_end is not None:
+            return
+        self.view_end = time.perf_counter()
+        self.view_ms = (self.view_end - self.view_start) * 1000 - (self.db_ms - self.view_db_ms)
+
+    def metrics(self, end):
+        """(name, duration ms, description) for the Server-Timing header"""
+        metrics = [('db', self.db_ms, f'{len(self.queries)} queries')]
+        if self.view_ms is not None:
+            metrics.append(('serialize', self.view_ms, 'view outside SQL'))
+            metrics.append(('render', (end - self.view_end) * 1000, ''))
+        metrics.append(('total', (end - self.start) * 1000, ''))
+        return metrics
+
+    def slowest(self, count=SLOW_LOG_QUERIES):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+
+    def repeated(self, count=SLOW_LOG_QUERIES):
+        """Statements run more than once with their run counts, a sign of N+1 queries"""
+        counts = Counter(sql for _, _, sql, _ in self.queries)
+        return [(sql, runs) for sql, runs in counts.most_common(count) if runs > 1]
+
+
+def server_timing_header(metrics):
+    parts = []
+    for name, duration, description in metrics:
+        part = f'{name};dur={duration:.1f}'
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header and log slow requests.
+
+    Place it near the top of ``MIDDLEWARE`` so ``total`` covers the other
+    middleware too. The view phase ends in ``process_template_response``,
+    which Django calls for DRF responses just before rendering them.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, stack = self.start(request)
+        with stack:
+            response = self.get_response(request)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, stack = self.start(request)
+        with stack:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings)
+
+    @staticmethod
+    def start(request):
+        timings = request.timings = RequestTimings()
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings))
+        return timings, stack
+
+    def finish(self, request, response, timings):
+        timings.view_finished()
+        end = time.perf_counter()
+
+        metrics = timings.metrics(end)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing_header(metrics)
+        self.log_if_slow(request, response, timings, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings.view_started()
+
+    def process_template_response(self, request, response):
+        request.timings.view_finished()
+        return response
+
+    @staticmethod
+    def log_if_slow(request, response, timings, metrics):
+        total_ms = metrics[-1][1]
+        if total_ms < settings.SLOW_REQUEST_MS and len(timings.queries) < settings.SLOW_REQUEST_QUERIES:
+            return
+        lines = [
+            f'Slow request {request.method} {request.get_full_path()} -> {response.status_code}: '
+            + ', '.join(f'{name} {duration:.1f} ms' for name, duration, _ in metrics)
+            + f', {len(timings.queries)} queries'
+        ]
+        for duration, alias, sql, params in timings.slowest():
+            lines.append(f'  {duration:8.1f} ms [{alias}] {sql} {params!r}')
+        repeated = timings.repeated()
+        if repeated:
+            lines.append('  Repeated statements:')
+            lines.extend(f'  {runs:>8}x {sql}' for sql, runs in repeated)
+        logger.warning('\n'.join(lines))
@@ -3,16 +3,29 @@ URL configuration for places app
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, PlaceViewSet, ReviewViewSet
+from . import async_views
+from .views import CategoryViewSet, PlaceViewSet, ReviewViewSet, SyncViewSet
 
 # Create router and register viewsets
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'places', PlaceViewSet, basename='place')
 router.register(r'reviews', ReviewViewSet, basename='review')
+router.register(r'sync', SyncViewSet, basename='sync')
 
 app_name = 'places'
 
+# Async versions of the read endpoints for ASGI servers
+async_urlpatterns = [
+    path('categories/', async_views.category_list, name='async-category-list'),
+    path('places/', async_views.place_list, name='async-place-list'),
+    path('places/featured/', async_views.place_featured, name='async-place-featured'),
+    path('places/<int:pk>/', async_views.place_detail, name='async-place-detail'),
+    path('reviews/', async_views.review_list, name='async-review-list'),
+]
+
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
+    path('live/', async_views.live_stream, name='live'),
     path('', include(router.urls)),
 ]
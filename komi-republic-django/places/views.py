@@ -1,41 +1,118 @@
 """
 Views for places app
 """
-from rest_framework import viewsets, filters
+import heapq
+import math
+
+from rest_framework import status, viewsets, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from django.db.models import Q
-from .models import Category, Place, Review
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from .amenities import filter_by_amenities, normalize as normalize_amenities
+from .autocomplete import suggest
+from .cache import CachedResponseMixin
+from .clusters import MAX_ZOOM, as_geojson, category_slugs, clusters_in_bbox, get_clusters
+from .conditional import ConditionalGetMixin
+from .filters import RankedOrderingFilter
+from .geo import geohash_cover, haversine_km
+from .models import Category, Place, PlaceImage, Review, SimilarPlace
+from .replicas import use_replicas
+from .rows import RowListMixin
+from .search import search_places
+from .similar import NEIGHBOURS
 from .serializers import (
     CategorySerializer,
+    PlaceBatchSerializer,
     PlaceListSerializer,
+    PlaceNearbySerializer,
     PlaceDetailSerializer,
+    PlaceImageSyncSerializer,
+    PlaceSyncSerializer,
     ReviewSerializer
 )
+from .sync import DeltaSync, encode_token
+from .write_behind import get_review_queue
+
+# Limits of /api/places/batch/
+BATCH_MAX_IDS = 100
+BATCH_MAX_REVIEWS = 20
+# Places returned by /api/places/{id}/similar/ without ?limit=
+SIMILAR_LIMIT = 5
+# Names accepted by ?amenities= and ?amenities_any=
+AMENITY_FILTER_MAX = 10
+# Largest ?radius_km= of /api/places/nearby/; wider circles would scan every place
+NEARBY_MAX_RADIUS_KM = 500
+
+
+class SparseFieldsMixin:
+    """Select only the columns needed for ?fields= / ?lang= on read actions"""
+    sparse_actions = ('list', 'retrieve')
+    # Columns always loaded, e.g. for pagination cursors
+    sparse_required_fields = ()
+
+    def apply_sparse_fields(self, queryset):
+        params = self.request.query_params
+        if self.action not in self.sparse_actions or not ('fields' in params or 'lang' in params):
+            return queryset
+        serializer = self.get_serializer()
+        only = ['pk', *serializer.get_only_fields(), *self.sparse_required_fields]
+
+        # Drop joins and prefetches that no remaining field reads
+        selected = queryset.query.select_related
+        if isinstance(selected, dict):
+            needed = [
+                name for name in selected
+                if any(path == name or path.startswith(f'{name}__') for path in only)
+            ]
+            queryset = queryset.select_related(None)
+            if needed:
+                queryset = queryset.select_related(*needed)
+        if 'images' not in serializer.fields and queryset._prefetch_related_lookups:
+            queryset = queryset.prefetch_related(None)
+        return queryset.only(*only)
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(SparseFieldsMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for viewing categories
     """
+    cache_models = (Category,)
     queryset = Category.objects.filter(published=True)
     serializer_class = CategorySerializer
     lookup_field = 'slug'
+    sparse_required_fields = ('name', 'slug')
+
+    def get_queryset(self):
+        return self.apply_sparse_fields(super().get_queryset())
 
 
-class PlaceViewSet(viewsets.ReadOnlyModelViewSet):
+class PlaceViewSet(SparseFieldsMixin, ConditionalGetMixin, CachedResponseMixin, RowListMixin,
+                   viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for viewing places
     """
+    # Review changes update the denormalized review aggregates on places
+    cache_models = (Category, Place, PlaceImage, Review, SimilarPlace)
+    conditional_actions = ('list', 'retrieve', 'featured', 'batch')
+    conditional_timestamps = ('updated_at', 'category__updated_at')
     queryset = Place.objects.filter(published=True).select_related('category').prefetch_related('images')
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'name_ru', 'description', 'description_ru', 'address', 'address_ru']
+    filter_backends = [RankedOrderingFilter]
     ordering_fields = ['rating', 'created_at', 'name', 'name_ru']
     ordering = ['-rating']
+    cursor_ordering = ['-rating', 'name_ru', 'id']
+    sparse_actions = ('list', 'retrieve', 'featured', 'batch', 'similar')
+    sparse_required_fields = ('rating', 'name_ru')
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PlaceDetailSerializer
+        if self.action == 'batch':
+            return PlaceBatchSerializer
+        if self.action == 'nearby':
+            return PlaceNearbySerializer
         return PlaceListSerializer
     
     def get_queryset(self):
@@ -45,37 +122,222 @@ class PlaceViewSet(viewsets.ReadOnlyModelViewSet):
         category = self.request.query_params.get('category', None)
         if category and category != 'all':
             queryset = queryset.filter(category__slug=category)
+
+        # Filter by amenities: all of ?amenities=, at least one of ?amenities_any=
+        all_of = self.get_amenity_filter('amenities')
+        any_of = self.get_amenity_filter('amenities_any')
+        if all_of or any_of:
+            queryset = filter_by_amenities(queryset, all_of, any_of)
         
-        # Search filter
+        # Full-text search, annotates search_rank
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(name_ru__icontains=search) |
-                Q(description__icontains=search) |
-                Q(description_ru__icontains=search)
-            )
+            queryset = search_places(queryset, search)
+
+        if self.action == 'batch':
+            queryset = queryset.filter(pk__in=self.get_batch_params()[0])
         
-        return queryset
+        return self.apply_sparse_fields(queryset)
+
+    def get_conditional_timestamps(self):
+        timestamps = super().get_conditional_timestamps()
+        if self.action == 'batch':
+            # Editing a review's text leaves the place untouched, so embedded relations add their own timestamps
+            include = self.get_batch_params()[1]
+            timestamps += tuple(f'{name}__updated_at' for name in ('images', 'reviews') if name in include)
+        return timestamps
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'batch':
+            context['include'] = self.get_batch_params()[1]
+        return context
+
+    def get_amenity_filter(self, param):
+        names = normalize_amenities(self.request.query_params.get(param, '').split(','))
+        if len(names) > AMENITY_FILTER_MAX:
+            raise ValidationError({param: f'At most {AMENITY_FILTER_MAX} amenities.'})
+        return names
+
+    def get_batch_params(self):
+        """(ids, include, reviews_limit) of a batch request"""
+        params = self.request.query_params
+        try:
+            ids = list(dict.fromkeys(int(value) for value in params.get('ids', '').split(',') if value.strip()))
+            reviews_limit = int(params.get('reviews_limit', 3))
+        except ValueError:
+            raise ValidationError('ids must be comma-separated integers and reviews_limit an integer.')
+        if not ids:
+            raise ValidationError({'ids': 'This parameter is required.'})
+        if len(ids) > BATCH_MAX_IDS:
+            raise ValidationError({'ids': f'At most {BATCH_MAX_IDS} ids per request.'})
+        include = {name.strip() for name in params.get('include', '').split(',') if name.strip()}
+        unknown = include - set(PlaceBatchSerializer.embedded_fields)
+        if unknown:
+            raise ValidationError({
+                'include': f'Must be a subset of: {", ".join(PlaceBatchSerializer.embedded_fields)}.'
+            })
+        return ids, include, max(1, min(reviews_limit, BATCH_MAX_REVIEWS))
+
+    def get_featured_limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', 4))
+        except ValueError:
+            raise ValidationError('limit must be an integer.')
+        return max(1, limit)
     
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Get featured places (top rated)"""
-        limit = int(request.query_params.get('limit', 4))
-        places = self.get_queryset().order_by('-rating')[:limit]
-        serializer = self.get_serializer(places, many=True)
+        limit = self.get_featured_limit()
+
+        def build():
+            places = self.get_queryset().order_by('-rating')[:limit]
+            return self.row_response(places, paginate=False)
+        return self.conditional_response(request, lambda: self.cached_response(request, build))
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get places by ?ids=1,5,9 in that order, embedding ?include=images,reviews,category"""
+        def build():
+            ids, include, reviews_limit = self.get_batch_params()
+            # One IN query for the places, one more per embedded relation;
+            # get_queryset() filters by ids and the order comes from ids
+            queryset = self.get_queryset().order_by().prefetch_related(None)
+            if 'category' not in include:
+                queryset = queryset.select_related(None)
+            if 'images' in include:
+                queryset = queryset.prefetch_related('images')
+            if 'reviews' in include:
+                # A sliced prefetch numbers each place's reviews with ROW_NUMBER() OVER
+                # (PARTITION BY place_id ORDER BY date DESC) and keeps the first rows
+                latest = Review.objects.filter(published=True).order_by('-date', '-id')[:reviews_limit]
+                queryset = queryset.prefetch_related(Prefetch('reviews', queryset=latest, to_attr='recent_reviews'))
+            places = {place.pk: place for place in queryset}
+            found = [places[place_id] for place_id in ids if place_id in places]
+            return Response({
+                'results': self.get_serializer(found, many=True).data,
+                'not_found': [place_id for place_id in ids if place_id not in places],
+            })
+        return self.conditional_response(request, lambda: self.cached_response(request, build))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Get the places most similar to this one, most similar first"""
+        def build():
+            try:
+                place_id = int(pk)
+            except ValueError:
+                raise NotFound
+            try:
+                limit = int(request.query_params.get('limit', SIMILAR_LIMIT))
+            except ValueError:
+                raise ValidationError('limit must be an integer.')
+            # One join on the precomputed neighbours, ordered by their rank
+            places = (
+                self.get_queryset().filter(similar_for__place_id=place_id)
+                .order_by('similar_for__rank')[:max(1, min(limit, NEIGHBOURS))]
+            )
+            response = self.row_response(places, paginate=False)
+            if not response.data and not Place.objects.filter(published=True, pk=place_id).exists():
+                raise NotFound
+            return response
+        return self.cached_response(request, build)
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Get name suggestions for a typed prefix from the in-memory index"""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError('limit must be an integer.')
+        return Response(suggest(request.query_params.get('q', ''), limit))
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """Get places within radius_km of lat/lon, closest first"""
+        params = request.query_params
+        try:
+            lat = float(params['lat'])
+            lon = float(params['lon'])
+            radius_km = float(params.get('radius_km', 10))
+            limit = int(params.get('limit', 50))
+        except KeyError as exc:
+            raise ValidationError({exc.args[0]: 'This parameter is required.'})
+        except ValueError:
+            raise ValidationError('lat, lon, radius_km and limit must be numbers.')
+        if not all(math.isfinite(value) for value in (lat, lon, radius_km)):
+            raise ValidationError('lat, lon and radius_km must be finite.')
+        if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+            raise ValidationError('lat/lon out of range.')
+        if radius_km <= 0 or limit <= 0:
+            raise ValidationError('radius_km and limit must be positive.')
+        limit = min(limit, 200)
+        radius_km = min(radius_km, NEARBY_MAX_RADIUS_KM)
+
+        # Narrow candidates with range scans over the indexed geohash column,
+        # then compute exact distances only for the rows inside those cells
+        prefixes = geohash_cover(lat, lon, radius_km)
+        if prefixes:
+            cells = Q()
+            for prefix in prefixes:
+                cells |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+            queryset = self.get_queryset().filter(cells).order_by()
+        else:
+            queryset = self.get_queryset().exclude(geohash='').order_by()
+
+        # Distances come from bare coordinates, full rows are loaded for the closest places only
+        distances = []
+        for place_id, place_lat, place_lon in queryset.values_list('pk', 'latitude', 'longitude'):
+            distance = haversine_km(lat, lon, place_lat, place_lon)
+            if distance <= radius_km:
+                distances.append((distance, place_id))
+        closest = heapq.nsmallest(limit, distances)
+        places = queryset.in_bulk([place_id for _, place_id in closest])
+        ordered = []
+        for distance, place_id in closest:
+            place = places[place_id]
+            place.distance_km = round(distance, 3)
+            ordered.append(place)
+
+        serializer = self.get_serializer(ordered, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """Get clustered map markers for bbox=min_lon,min_lat,max_lon,max_lat and zoom as GeoJSON"""
+        params = request.query_params
+        try:
+            zoom = int(params.get('zoom', 0))
+            bbox = [float(value) for value in params.get('bbox', '-180,-90,180,90').split(',')]
+        except ValueError:
+            raise ValidationError('zoom must be an integer and bbox four comma-separated numbers.')
+        if len(bbox) != 4:
+            raise ValidationError('bbox must be min_lon,min_lat,max_lon,max_lat.')
+        zoom = max(0, min(zoom, MAX_ZOOM))
+
+        category = params.get('category')
+        if category == 'all':
+            category = None
+        # Every distinct value would build and cache clusters of its own
+        if category and category not in category_slugs():
+            raise ValidationError({'category': 'Unknown category.'})
+        clusters = get_clusters(zoom, category)
+        return Response(as_geojson(clusters_in_bbox(clusters, *bbox)))
+
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for viewing and creating reviews
     """
+    cache_models = (Review,)
+    cached_actions = ('list',)
     queryset = Review.objects.filter(published=True)
     serializer_class = ReviewSerializer
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['date', 'rating', 'created_at']
     ordering = ['-date']
+    cursor_ordering = ['-date', 'id']
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -83,6 +345,64 @@ class ReviewViewSet(viewsets.ModelViewSet):
         # Filter by place
         place_id = self.request.query_params.get('place', None)
         if place_id:
-            queryset = queryset.filter(place_id=place_id)
+            try:
+                queryset = queryset.filter(place_id=int(place_id))
+            except ValueError:
+                raise ValidationError({'place': 'Must be an integer.'})
         
         return queryset
+
+    def create(self, request, *args, **kwargs):
+        if not settings.REVIEW_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not get_review_queue().put(serializer.validated_data):
+            # Queue full, write this one right away
+            self.perform_create(serializer)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    # One transaction per write: with transaction_mode IMMEDIATE, SQLite takes the
+    # write lock up front and waits for it instead of failing on a lock upgrade
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Changes since ?since=<token> for offline clients
+    """
+    serializer_classes = {
+        'categories': CategorySerializer,
+        'places': PlaceSyncSerializer,
+        'images': PlaceImageSyncSerializer,
+        'reviews': ReviewSerializer,
+    }
+
+    def list(self, request):
+        try:
+            sync = DeltaSync(request.query_params.get('since'))
+        except ValueError:
+            raise ValidationError({'since': 'Invalid sync token.'})
+        # A lagging replica could hide rows behind a position handed out to the client
+        with use_replicas(False):
+            page = sync.run()
+
+        context = {'request': request}
+        data = {'token': encode_token(page.positions), 'has_more': page.has_more, 'reset': page.reset}
+        for key, serializer_class in self.serializer_classes.items():
+            data[key] = {
+                'changed': serializer_class(page.changed[key], many=True, context=context).data,
+                'deleted': page.deleted[key],
+            }
+        return Response(data)
@@ -0,0 +1,121 @@
+"""
+Write-behind queue for reviews in places app
+
+With ``REVIEW_WRITE_BEHIND`` on, ``POST /api/reviews/`` validates the review,
+queues it and answers ``202 Accepted`` right away. A background thread in
+each worker inserts the queued reviews with one ``bulk_create`` per batch of
+``REVIEW_BATCH_SIZE`` or every ``REVIEW_FLUSH_INTERVAL`` seconds, recounts the
+aggregates of the affected places in the same transaction and bumps the
+review cache generation once. On SQLite this turns many small write
+transactions competing for the database lock into a few large ones.
+
+Queued reviews live in worker memory until they are flushed: a worker that
+is killed (not stopped) loses up to one interval of reviews. Reviews are
+written synchronously when the queue is full.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .aggregates import recompute_review_aggregates
+from .cache import bump_generation, model_generation
+from .live import publish_changes
+from .models import Place, Review
+
+logger = logging.getLogger(__name__)
+
+# Reviews waiting per worker before POSTs fall back to synchronous inserts
+MAX_PENDING = 10000
+
+
+class ReviewWriteQueue:
+    def __init__(self, batch_size=100, interval=0.5, using='default'):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.using = using
+        self.pid = os.getpid()
+        self.pending = queue.Queue(maxsize=MAX_PENDING)
+        self.write_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='review-write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def put(self, data):
+        """Queue validated review data; False when the queue is full"""
+        try:
+            self.pending.put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.write_logged(batch)
+
+    def write_logged(self, batch):
+        with self.write_lock:
+            close_old_connections()
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception('Could not write %s queued review(s)', len(batch))
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+
+    def write(self, batch):
+        reviews = [Review(**data) for data in batch]
+        place_ids = {review.place_id for review in reviews}
+        with transaction.atomic(using=self.using):
+            Review.objects.using(self.using).bulk_create(reviews)
+            # bulk_create sends no signals, so do what the Review handlers would
+            recompute_review_aggregates(place_ids=place_ids, using=self.using)
+            Place.objects.using(self.using).filter(pk__in=place_ids).update(updated_at=timezone.now())
+        bump_generation(model_generation(Review))
+        publish_changes([review.pk for review in reviews], place_ids, using=self.using)
+        return reviews
+
+    def flush(self):
+        """Write everything queued so far, returning once the background thread is idle too"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            self.write_logged(batch)
+        # The background thread may still be collecting a batch it already took
+        self.pending.join()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_review_queue():
+    global _queue
+    if _queue is None or _queue.pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue.pid != os.getpid():
+                _queue = ReviewWriteQueue(settings.REVIEW_BATCH_SIZE, settings.REVIEW_FLUSH_INTERVAL)
+    return _queue